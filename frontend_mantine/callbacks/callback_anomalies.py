@@ -4,7 +4,6 @@ from pages.anomalies import elements
 import utils.functions_general as FcGen
 import pandas as pd
 import numpy as np
-import utils.functions_analysis as FcAnalysis
 import utils.functions_api_data as FcAPI
 import utils.functions_plot as FcPlot
 from globals import token_
@@ -74,38 +73,28 @@ def cleaned_data_from_outliers(url_app, bui_name):
         # Filter out rows where the 'label' column contains "Outside" or "External"
         filtered_df = df[~df['label'].str.contains('Outside|External', case=False)]
         
-        # Initialize an empty DataFrame to store the outliers
-        df_outliers_overall = pd.DataFrame()
+        # Detect the outliers of every parameter using the Z-score method, computed by the API
+        df_outliers = FcAPI.get_outliers_of_sensors(filtered_df['value'].tolist(), token_)
         
-        # For each parameter in the filtered DataFrame, fetch the data and detect outliers
+        # Keep the first outlier of each parameter, with its building name, label and UUID
+        df_outliers_overall = pd.DataFrame()
         for i, row in filtered_df.iterrows():
             label = row['label']
             uuid = row['value']
             
-            # Get data for each parameter using its UUID
-            df_param = FcAPI.get_data_from_param(uuid, token_, False, "", "")
-            
-            if df_param is not None and not df_param.empty:
-                df_param = df_param.dropna()
-                
-                # Detect outliers using the Z-score method
-                df_outliers = FcAnalysis.detect_outliers(df_param, uuid, "Z_SCORE")
-                
-                if not df_outliers.empty:
-                    # Reset the index and format the data correctly
-                    df__ = df_outliers.reset_index()
-                    df__['Name'] = bui_name.replace("bui_", "")  # Remove the "bui_" prefix from the building name
-                    df__['Sensor'] = label  # Set the sensor label
-                    df__['uuid'] = uuid  # Set the UUID for the sensor
-                    df__['Value'] = df__[uuid].values[0].round(2)  # Round the value to two decimal places
-                    df__['Time'] = df__["time"].values[0]  # Set the timestamp of the anomaly
-                    
-                    # Select only relevant columns and add the data to the overall outliers DataFrame
-                    df_bui = df__.loc[:, ['Name', 'Sensor', "uuid", 'Value', 'Time']]
-                    df_outliers_overall = pd.concat([df_outliers_overall, df_bui])
+            df_param = df_outliers[df_outliers['sensor_id'] == str(uuid).lower()]
+            if not df_param.empty:
+                df_bui = pd.DataFrame([{
+                    'Name': bui_name.replace("bui_", ""),  # Remove the "bui_" prefix from the building name
+                    'Sensor': label,  # Set the sensor label
+                    'uuid': uuid,  # Set the UUID for the sensor
+                    'Value': round(df_param['value'].iloc[0], 2),  # Round the value to two decimal places
+                    'Time': df_param['time'].iloc[0],  # Set the timestamp of the anomaly
+                }])
+                df_outliers_overall = pd.concat([df_outliers_overall, df_bui])
         
         # If outliers were found, remove duplicates based on the 'Time' column and reset the index
-        if not df_outliers.empty:
+        if not df_outliers_overall.empty:
             df_outliers_overall = df_outliers_overall.drop_duplicates(subset="Time").reset_index(drop=True)
             df_outliers_overall = df_outliers_overall.reset_index().to_dict('records')  # Convert DataFrame to list of dictionaries
         else:
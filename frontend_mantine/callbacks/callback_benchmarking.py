@@ -338,40 +338,13 @@ def buis_comparison(bui_1, bui_2, data_bui_uuid):
             time_start = st_end['time'][0].split('T')[0]
             time_end = st_end['time'][1].split('T')[0]
             # ================================
-            # Get External Temperature    
+            # Get HDD/CDD and daily energy (power/4) computed by the API from the daily rollups
             # ================================
-            df = FcAPI.get_data_from_shops(id_ext_temp, time_start, time_end, token_)
-            df.index = pd.to_datetime(df['time'])
-            del df['time']
-            df_daily = df.resample('D').mean()
-            df_daily = df_daily.reset_index()
-            # Rename columns
-            df_daily.columns = ['time','temperature']
-            # Calculate HDD
-            df_DD = FcAPI.calculate_degree_days(df_daily)
-
-
-            # ================================
-            # Get Power data    
-            # ================================
-            df_power = FcAPI.get_data_from_shops(id_power, time_start, time_end, token_)
-            if not df_power.empty: 
-                df_power.columns = ['time','power']
-                df_power.index = pd.to_datetime(df_power['time'])
-                # From power to energy
-                df_power['energy'] = df_power['power']/4
+            df_DD = FcAPI.get_degree_days(id_ext_temp, token_, time_start, time_end, id_power=id_power)
+            if not df_DD.empty: 
                 # from ENergy overall to energy to m2
                 building_area = FcAPI.extract_numeric_value(FcAPI.get_area_from_bui(bui['building']))
-                df_power['energy'] = df_power['energy']/building_area
-                del df_power['time']
-                del df_power['power']
-                df_power_daily = df_power.resample('D').sum()
-
-                # ================================
-                # MERGE data
-                # ================================
-                df_power_daily = df_power_daily.reset_index()
-                df_DD = FcAPI.safe_merge(df_DD, df_power_daily, 'time', how='inner')
+                df_DD['energy'] = df_DD['energy']/building_area
                 df_DD = df_DD.dropna().reset_index(drop=True)
                 # df_DD['energy'] = round(df_power_daily['energy'],2).values.tolist()
                 
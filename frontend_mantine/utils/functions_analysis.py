@@ -1,5 +1,9 @@
 # GET DATA FROM BUILDING
 import requests
+import gzip
+import shutil
+import tempfile
+import zstandard
 import pandas as pd
 import numpy as np 
 from sklearn.cluster import DBSCAN
@@ -74,6 +78,49 @@ def get_data_from_shops(url_shops, id_mesurement, time_start, time_end, token_):
     return df_data
 
 
+def get_wide_data_from_shops(url_shops, id_measurements, time_start, time_end, token_):
+    '''
+    Retrieve time-series data for several measurements with a single request to the shops API.
+
+    Parameters
+    ----------
+    url_shops : str
+        URL of the shops API endpoint (e.g., "api.example.com").
+    id_measurements : list
+        IDs of the measurements (retrievable from a JSON or metadata file).
+    time_start : str
+        Start time for the data query in the format 'YYYY-MM-DD' (e.g., '2022-09-15').
+    time_end : str
+        End time for the data query in the format 'YYYY-MM-DD' (e.g., '2022-09-15').
+    token_ : str
+        Authentication token obtained using the function `get_token_auth_shops`.
+
+    Returns
+    -------
+    pd.DataFrame
+        A pandas DataFrame with a 'time' column and one column per measurement ID,
+        aligned on time (outer join, NaN where a sensor has no value).
+    '''
+
+    # Construct the API endpoint URL; every measurement ID is passed as a 'sensor_id' query parameter.
+    url = f"http://{url_shops}/store_data/api/v1/measurements/wide"
+    params = [('sensor_id', sens) for sens in id_measurements]
+    params += [('time_from', time_start), ('time_to', time_end)]
+
+    # Define the authorization header using the provided token.
+    headers = {'Authorization': f'Bearer {token_}'}
+
+    # Send a GET request to the API and parse the column-oriented JSON response into a pandas DataFrame.
+    response = requests.get(url, headers=headers, params=params)
+    df_data = pd.DataFrame(response.json())
+
+    # Convert the 'time' column to datetime format for easier time-based analysis.
+    df_data['time'] = pd.to_datetime(df_data['time'])
+
+    # Return the processed DataFrame.
+    return df_data
+
+
 def get_data_multiple_param(selected_param, df_metadata, selected_bui, time_start, time_end, token_):
     '''
     Retrieve and process data for multiple parameters (e.g., temperature and energy) from sensors.
@@ -120,15 +167,8 @@ def get_data_multiple_param(selected_param, df_metadata, selected_bui, time_star
         # Filter metadata for temperature parameters
         df__t = df_.loc[temp_p]
 
-        # Retrieve temperature data from sensors
-        data_sensors = []
-        for sens in df__t.values.flatten().tolist():
-            data_sensors.append(get_data_from_shops(url_shops, sens, time_start, time_end, token_))
-
-        # Merge the retrieved DataFrames for temperature data
-        merged_df_temp = data_sensors[0]
-        for df__s in data_sensors[1:]:
-            merged_df_temp = pd.merge(merged_df_temp, df__s, on='time', how='outer')
+        # Retrieve temperature data from all sensors, already aligned on time
+        merged_df_temp = get_wide_data_from_shops(url_shops, df__t.values.flatten().tolist(), time_start, time_end, token_)
 
         # Format the resulting DataFrame
         if not merged_df_temp.empty:
@@ -144,15 +184,8 @@ def get_data_multiple_param(selected_param, df_metadata, selected_bui, time_star
         # Filter metadata for energy parameters
         df__p = df_.loc[power_p]
 
-        # Retrieve energy data from sensors
-        data_sensors_power = []
-        for sens_p in df__p.values.flatten().tolist():
-            data_sensors_power.append(get_data_from_shops(url_shops, sens_p, time_start, time_end, token_))
-
-        # Merge the retrieved DataFrames for energy data
-        merged_df_power = data_sensors_power[0]
-        for df__s in data_sensors_power[1:]:
-            merged_df_power = pd.merge(merged_df_power, df__s, on='time', how='outer')
+        # Retrieve energy data from all sensors, already aligned on time
+        merged_df_power = get_wide_data_from_shops(url_shops, df__p.values.flatten().tolist(), time_start, time_end, token_)
 
         # Format the resulting DataFrame
         if not merged_df_power.empty:
@@ -212,7 +245,7 @@ def detect_outliers(df: pd.DataFrame, colName: str, method: str):
     return outliers
 
 
-def post_data(csv_path, bearerAuth, file_name):
+def post_data(csv_path, bearerAuth, file_name, compression=None):
     '''
     Post time-series data to a TimescaleDB using the API.
 
@@ -224,6 +257,9 @@ def post_data(csv_path, bearerAuth, file_name):
         Authentication token (Bearer token) for the API.
     file_name : str
         Name of the file to be uploaded, as it will appear in the API.
+    compression : str, optional
+        'gzip' or 'zstd' to compress the file before sending it (the API decompresses it
+        while loading it). Sensor CSV files shrink about 10x, useful on slow links.
 
     Returns
     -------
@@ -234,18 +270,34 @@ def post_data(csv_path, bearerAuth, file_name):
     # API endpoint for uploading time-series data
     url = "http://193.106.182.151/store_data/api/v1/measurements"
 
-    # Open the CSV file in binary mode for upload
-    with open(csv_path, 'rb') as file:
-        # Prepare the file as a multipart/form-data payload for the POST request
-        files = [
-            ('file', (file_name, file, 'text/csv'))
-        ]
-        
-        # Headers for the request, including the Bearer token for authentication
-        headers = {
-            'Accept': 'application/json',
-            'Authorization': 'Bearer ' + bearerAuth  # Add the authentication token
-        }
+    # Headers for the request, including the Bearer token for authentication
+    headers = {
+        'Accept': 'application/json',
+        'Authorization': 'Bearer ' + bearerAuth  # Add the authentication token
+    }
+
+    # Open the CSV file in binary mode for upload, compressed into a temporary file if requested
+    with open(csv_path, 'rb') as file, tempfile.TemporaryFile() as compressed:
+        if compression == 'gzip':
+            with gzip.GzipFile(fileobj=compressed, mode='wb') as writer:
+                shutil.copyfileobj(file, writer)
+        elif compression == 'zstd':
+            with zstandard.ZstdCompressor().stream_writer(compressed, closefd=False) as writer:
+                shutil.copyfileobj(file, writer)
+        elif compression is not None:
+            raise ValueError(f"Unsupported compression '{compression}', use 'gzip' or 'zstd'.")
+
+        if compression:
+            compressed.seek(0)
+            # The Content-Encoding header of the part tells the API how to decompress it
+            files = [
+                ('file', (file_name, compressed, 'text/csv', {'Content-Encoding': compression}))
+            ]
+        else:
+            # Prepare the file as a multipart/form-data payload for the POST request
+            files = [
+                ('file', (file_name, file, 'text/csv'))
+            ]
 
         # Send the POST request with the file and headers
         response = requests.post(url, headers=headers, files=files)
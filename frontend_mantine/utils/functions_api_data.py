@@ -1,10 +1,12 @@
 import requests
 from globals import url_api_data_metadata, url_shops
 import pandas as pd
+import pyarrow as pa
 import json 
 import numpy as np
 from workalendar.europe import Italy
 import re
+from collections import OrderedDict
 
 # url_api_data_metadata = "http://127.0.0.1:8000"
 # url_shops = '193.106.182.151'
@@ -330,6 +332,14 @@ def extract_numeric_value(data):
 '''
 Query to the timescale API to get time series data
 '''
+# Media type of the Arrow IPC stream returned by the timescale API
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Responses of `get_data_from_shops` kept with their ETag: url -> (etag, DataFrame).
+# Repeat requests are conditional and a 304 reuses the cached DataFrame.
+RESPONSE_CACHE_SIZE = 32
+_response_cache = OrderedDict()
+
 def get_first_and_last_value(id_measurement, token_):
     '''
     Retrieves the first and last value of a measurement.
@@ -368,7 +378,7 @@ def get_first_and_last_value(id_measurement, token_):
 
 
     
-def get_data_from_shops(id_mesurement, time_start, time_end, token_):
+def get_data_from_shops(id_mesurement, time_start, time_end, token_, bucket=None, agg='mean', fill=None, points=None):
     '''
     Retrieves data from a TimescaleDB where sensor data is stored.
 
@@ -378,6 +388,13 @@ def get_data_from_shops(id_mesurement, time_start, time_end, token_):
     time_start: Start date (e.g., '2022-09-15').
     time_end: End date (e.g., '2022-09-16').
     token_: Authentication token for the API (obtained from `get_token_auth_shops`).
+    bucket: Optional bucket width ('15min', '1h', '1d', '1w', '1mo'). If given, the data
+        is aggregated by the database instead of returning every raw measurement.
+    agg: Aggregation applied to each bucket ('mean', 'sum', 'min', 'max', 'count').
+    fill: Optional gap filling ('null', 'locf', 'linear'), used with `bucket`: every bucket between
+        `time_start` and `time_end` is returned, so the series sits on a regular grid.
+    points: Optional maximum number of rows (e.g. 2000 for a chart), downsampled by the API
+        with Largest-Triangle-Three-Buckets so that peaks and troughs are kept.
 
     Returns:
     --------
@@ -385,19 +402,40 @@ def get_data_from_shops(id_mesurement, time_start, time_end, token_):
     '''
     # Constructs the URL to obtain the measurement data
     url = f"http://{url_shops}/store_data/api/v1/measurements/{id_mesurement}?time_from={time_start}&time_to={time_end}"
+    if bucket:
+        url += f"&bucket={bucket}&agg={agg}"
+        if fill:
+            url += f"&fill={fill}"
+    if points:
+        url += f"&points={points}"
     
-    # Sets the header to include the authentication token
-    headers = {'Authorization': f'Bearer {token_}'}
+    # Sets the header to include the authentication token and asks for the Arrow columnar format
+    headers = {'Authorization': f'Bearer {token_}', 'Accept': ARROW_MEDIA_TYPE}
+    # Revalidates the cached copy, if any: the body is only sent again if the range changed
+    cached = _response_cache.get(url)
+    if cached:
+        headers['If-None-Match'] = cached[0]
     
     # Sends a GET request to retrieve the data
     response = requests.request("GET", url, headers=headers)
     
+    # Not modified: returns a copy of the cached DataFrame
+    if response.status_code == 304 and cached:
+        _response_cache.move_to_end(url)
+        return cached[1].copy()
+
     # Converts the response into a DataFrame
-    df_data = pd.DataFrame(response.json())
+    if response.headers.get('content-type', '').startswith(ARROW_MEDIA_TYPE):
+        # Arrow stream: timestamps and values are already typed, no string parsing needed
+        df_data = pa.ipc.open_stream(response.content).read_pandas()
+    else:
+        # JSON fallback (servers without Arrow support)
+        df_data = pd.DataFrame(response.json())
+        if not df_data.empty:
+            df_data['time'] = pd.to_datetime(df_data['time'])  # Converts 'time' column to datetime format
     
     # If the data is not empty, processes the DataFrame to set the 'time' column as the index
     if not df_data.empty:
-        df_data['time'] = pd.to_datetime(df_data['time'])  # Converts 'time' column to datetime format
         del df_data['sensor_id']  # Removes the 'sensor_id' column
         df_data.columns = ['time', id_mesurement]  # Renames columns for clarity
     else:
@@ -407,10 +445,96 @@ def get_data_from_shops(id_mesurement, time_start, time_end, token_):
             f"{id_mesurement}": []
         })
 
+    # Keeps the DataFrame for the next request of the same range
+    etag = response.headers.get('ETag')
+    if etag:
+        _response_cache[url] = (etag, df_data.copy())
+        _response_cache.move_to_end(url)
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
     # Returns the DataFrame with the data
     return df_data
 
 
+def get_wide_data_from_shops(id_measurements:list, time_start:str, time_end:str, token_:str, bucket=None, agg='mean', fill=None)->pd.DataFrame:
+    '''
+    Retrieves data from multiple measurements with a single request, already aligned on time.
+
+    Parameters:
+    -----------
+    id_measurements: List of measurement IDs (e.g., ['ce2bea9e...', '0c20c529...']).
+    time_start: Start date (e.g., '2022-09-15').
+    time_end: End date (e.g., '2022-09-16').
+    token_: Authentication token for the API (obtained from `get_token_auth_shops`).
+    bucket: Optional bucket width ('15min', '1h', '1d', '1w', '1mo') to aggregate the data in the database.
+    agg: Aggregation applied to each bucket ('mean', 'sum', 'min', 'max', 'count').
+    fill: Optional gap filling ('null', 'locf', 'linear'), used with `bucket`: every bucket between
+        `time_start` and `time_end` is returned for every measurement.
+
+    Returns:
+    --------
+    DataFrame with a 'time' column and one column per measurement ID (NaN where a sensor has no value).
+    '''
+    # Constructs the URL and the query parameters (one 'sensor_id' per measurement)
+    url = f"http://{url_shops}/store_data/api/v1/measurements/wide"
+    params = [('sensor_id', id_measure) for id_measure in id_measurements]
+    params += [('time_from', time_start), ('time_to', time_end)]
+    if bucket:
+        params += [('bucket', bucket), ('agg', agg)]
+        if fill:
+            params += [('fill', fill)]
+
+    # Sets the header to include the authentication token
+    headers = {'Authorization': f'Bearer {token_}'}
+
+    # Sends a GET request to retrieve the data
+    response = requests.get(url, headers=headers, params=params)
+
+    # Converts the column-oriented response into a DataFrame
+    df_data = pd.DataFrame(response.json())
+    df_data['time'] = pd.to_datetime(df_data['time'])
+
+    return df_data
+
+
+def get_building_wide_data(building:str, time_start:str, time_end:str, token_:str, kind=None, bucket=None, agg='mean', fill=None)->pd.DataFrame:
+    '''
+    Retrieves the data of all the sensors of a building registered in the API (optionally of one kind)
+    with a single request, without resolving their UUIDs through the metadata API first.
+
+    Parameters:
+    -----------
+    building: Building code as in the sensor registry (e.g., 'BCFT').
+    time_start: Start date (e.g., '2022-09-15').
+    time_end: End date (e.g., '2022-09-16').
+    token_: Authentication token for the API (obtained from `get_token_auth_shops`).
+    kind: Optional sensor kind ('indoor_temperature', 'outdoor_temperature', 'hvac_power', 'global_power').
+    bucket, agg, fill: Optional aggregation and gap filling, as in `get_wide_data_from_shops`.
+
+    Returns:
+    --------
+    DataFrame with a 'time' column and one column per sensor UUID (NaN where a sensor has no value).
+    '''
+    url = f"http://{url_shops}/store_data/api/v1/buildings/{building}/measurements/wide"
+    params = [('time_from', time_start), ('time_to', time_end)]
+    if kind:
+        params.append(('kind', kind))
+    if bucket:
+        params += [('bucket', bucket), ('agg', agg)]
+        if fill:
+            params.append(('fill', fill))
+
+    headers = {'Authorization': f'Bearer {token_}'}
+    response = requests.get(url, headers=headers, params=params)
+
+    if response.status_code != 200:
+        return pd.DataFrame({"time": []})
+    df_data = pd.DataFrame(response.json())
+    df_data['time'] = pd.to_datetime(df_data['time'])
+    return df_data
+
+
 def get_values_from_multiparameters(id_measurements:list, time_start:str, time_end:str, token_:str )->pd.DataFrame:
     '''
     Retrieves data from multiple measurements in a single DataFrame.
@@ -426,20 +550,9 @@ def get_values_from_multiparameters(id_measurements:list, time_start:str, time_e
     --------
     DataFrame with data from all measurements for the specified time period.
     '''
-    # Creates a list to collect the DataFrames for each measurement
-    dataframes = []
-    
-    # Iterates over each measurement ID and retrieves the data
-    for id_measure in id_measurements:
-        df = get_data_from_shops(id_measure, time_start, time_end, token_)
-        dataframes.append(df)
-
-    # If there are DataFrames in the list, concatenate the obtained data
-    if dataframes:
-        # Merges the DataFrames on the 'time' column
-        merged_df = pd.concat(dataframes, axis=1).drop_duplicates(subset=['time']).reset_index(drop=True)
-        # Removes duplicated columns
-        merged_df = merged_df.loc[:, ~merged_df.columns.duplicated()]
+    # Retrieves all the measurements with one request, aligned on the 'time' column
+    if id_measurements:
+        merged_df = get_wide_data_from_shops(id_measurements, time_start, time_end, token_)
     else:
         # If no data, returns an empty DataFrame
         merged_df = pd.DataFrame()
@@ -931,6 +1044,121 @@ def get_mean_sum_count_energy_periods(id_measurement, shop_name, token_, time_co
 
 
 
+def get_energy_periods(id_measurements, token_, time_start=None, time_end=None, by_month=False):
+    '''
+    Retrieves the sum, mean and count of the values of several energy meters during the Day (7 AM - 8 PM)
+    and Night (9 PM - 5 AM) periods with a single request; the grouping is computed by the API.
+
+    Parameters:
+    -----------
+    id_measurements : list
+        The IDs of the measurements to be analyzed.
+    token_ : str
+        The authentication token for accessing the data.
+    time_start, time_end : str, optional
+        Time range (e.g., '2022-09-15'); the whole history if not given.
+    by_month : bool
+        If True, the periods are also split by month ('month' column).
+
+    Returns:
+    --------
+    pd.DataFrame
+        One row per sensor (and month) and period with the columns 'sensor_id', 'period', 'sum', 'mean' and 'count'.
+    '''
+    url = f"http://{url_shops}/store_data/api/v1/energy/periods"
+    headers = {'Authorization': f'Bearer {token_}'}
+    params = [('sensor_id', id_measure) for id_measure in id_measurements]
+    params += [('opening_from', 7), ('opening_to', 20), ('by_month', str(by_month).lower())]
+    if time_start:
+        params.append(('time_from', time_start))
+    if time_end:
+        params.append(('time_to', time_end))
+
+    response = requests.get(url, headers=headers, params=params)
+
+    df_data = pd.DataFrame(response.json() if response.status_code == 200 else [],
+                           columns=['sensor_id'] + (['month'] if by_month else []) + ['period', 'sum', 'mean', 'count'])
+    # Same labels as `assign_period`
+    df_data['period'] = df_data['period'].map({"opening": "Day (7 AM - 8 PM)", "closing": "Night (9 PM - 5 AM)"})
+    return df_data
+
+
+def get_energy_periods_all_shops(token_):
+    '''
+    Same result as `get_mean_sum_count_energy_periods` for the energy meter of every shop,
+    with one request for all the shops instead of downloading the history of each one.
+
+    Returns:
+    --------
+    pd.DataFrame
+        The sum, mean and count of energy usage of each shop and period (normalized by the building area when known),
+        with the 'shops' and 'area building' columns.
+    '''
+    energy_meter_shops = pd.DataFrame(get_list_energy_meters_all_shops())
+    periods = get_energy_periods(energy_meter_shops['uuid'].tolist(), token_)
+
+    stats = pd.DataFrame()
+    for i, bui in energy_meter_shops.iterrows():
+        grouped = periods[periods['sensor_id'] == str(bui['uuid']).lower()][['period', 'sum', 'mean', 'count']].reset_index(drop=True)
+        if grouped.empty:
+            continue
+
+        try:
+            # Try to extract the building area for normalization
+            area_building = extract_numeric_value(get_area_from_bui(f"bui_{bui['shops']}"))
+        except:
+            area_building = None
+
+        if area_building:
+            grouped['sum'] = round(grouped['sum'] / area_building, 4)
+            grouped['mean'] = round(grouped['mean'] / area_building, 4)
+        else:
+            grouped['sum'] = round(grouped['sum'], 4)
+            grouped['mean'] = round(grouped['mean'], 4)
+        grouped['count'] = grouped['count'].round(0)
+        grouped['shops'] = bui['shops']
+        grouped['area building'] = area_building if area_building else np.NaN
+        stats = pd.concat([stats, grouped])
+
+    return stats
+
+
+def get_outliers_of_sensors(id_measurements, token_, window=None, threshold=3):
+    '''
+    Retrieves only the outliers of several sensors, detected by the API with a z-score
+    computed in the database, instead of downloading their whole history.
+
+    Parameters:
+    -----------
+    id_measurements : list
+        The IDs of the measurements to be analyzed.
+    token_ : str
+        The authentication token for accessing the data.
+    window : int, optional
+        Number of previous measurements of the rolling z-score; the z-score is computed
+        over the whole history of each sensor if not given (as `stats.zscore`).
+    threshold : float
+        Absolute z-score above which a measurement is an outlier.
+
+    Returns:
+    --------
+    pd.DataFrame
+        One row per outlier with the columns 'time', 'sensor_id', 'value', 'mean', 'stddev' and 'zscore'.
+    '''
+    url = f"http://{url_shops}/store_data/api/v1/outliers"
+    headers = {'Authorization': f'Bearer {token_}'}
+    params = [('sensor_id', id_measure) for id_measure in id_measurements]
+    params.append(('threshold', threshold))
+    if window:
+        params.append(('window', window))
+
+    response = requests.get(url, headers=headers, params=params)
+
+    df_data = pd.DataFrame(response.json() if response.status_code == 200 else [],
+                           columns=['time', 'sensor_id', 'value', 'mean', 'stddev', 'zscore'])
+    return df_data
+
+
 # ========================================================
 #               ANALYSIS ALL BUIDLIONGS 
 # ========================================================
@@ -943,13 +1171,8 @@ def table_overview(API_token, time_col_name, el_price):
     time_col_name: Name of the time coluns
     el_price: elctricity price in euro
     '''
-    # Get meter UUID
-    energy_meter_shops = pd.DataFrame(get_list_energy_meters_all_shops())
-
-    df = pd.DataFrame()
-    for i,bui in energy_meter_shops.iterrows():
-        stat_bui, df__ = get_mean_sum_count_energy_periods(bui['uuid'], bui['shops'], API_token, time_col_name)
-        df = pd.concat([df,stat_bui])
+    # Day/night statistics of every shop, grouped by the API in one request
+    df = get_energy_periods_all_shops(API_token)
     # 
     areas = df[df.index == 0]["area building"].tolist()
 
@@ -1014,6 +1237,42 @@ def calculate_degree_days(df, temperature_label='temperature'):
     return df
 
 
+def get_degree_days(id_temperature, token_, time_start=None, time_end=None, id_power=None):
+    '''
+    Retrieve the daily Heating Degree Days (HDD) and Cooling Degree Days (CDD) of an outdoor temperature sensor,
+    computed by the API from the daily means (same bases and seasons as `calculate_degree_days`).
+    Parameters:
+    -----------
+    id_temperature: ID of the outdoor temperature measurement.
+    token_: Authentication token for the API.
+    time_start, time_end: Optional time range (e.g., '2022-09-15'); the whole history if not given.
+    id_power: Optional ID of a power measurement (15 minutes): its daily energy (power / 4) is added
+        in an 'energy' column and only the days with both temperature and power are returned.
+
+    Returns:
+    --------
+    DataFrame with the 'time', 'temperature', 'HDD', 'CDD' and 'month' columns (and 'energy').
+    '''
+    url = f"http://{url_shops}/store_data/api/v1/degree_days/{id_temperature}"
+    headers = {'Authorization': f'Bearer {token_}'}
+    params = []
+    if time_start:
+        params.append(('time_from', time_start))
+    if time_end:
+        params.append(('time_to', time_end))
+    if id_power:
+        params.append(('power_sensor_id', id_power))
+
+    response = requests.get(url, headers=headers, params=params)
+
+    columns = ['time', 'temperature', 'hdd', 'cdd'] + (['energy'] if id_power else [])
+    df = pd.DataFrame(response.json() if response.status_code == 200 else [], columns=columns)
+    df = df.rename(columns={'hdd': 'HDD', 'cdd': 'CDD'})
+    df['time'] = pd.to_datetime(df['time'])
+    df['month'] = df['time'].dt.month
+    return df
+
+
 
 def typical_day(id_measurement, time_col_name, token_, year_selected=2022, month_selected=2):
     """
@@ -1160,18 +1419,9 @@ def typical_week(id_temperature, id_power, token_, time_col_name="time"):
         # ================================
         df = get_data_from_shops(id_temperature, time_start, time_end, token_)
         
-        # Calculate daily mean temperature
-        df_daily = df.copy()
-        df_daily.index = pd.to_datetime(df['time'])
-        del df_daily['time']
-        df_daily = df_daily.resample('D').mean()
-        df_daily = df_daily.reset_index()
-        
-        # Rename columns for clarity
-        df_daily.columns = ['time', 'temperature']
-        
-        # Calculate Heating Degree Days (HDD) and Cooling Degree Days (CDD)
-        df_DD = calculate_degree_days(df_daily)
+        # Daily Heating Degree Days (HDD) and Cooling Degree Days (CDD) with the daily energy,
+        # computed by the API from the daily rollups
+        df_DD = get_degree_days(id_temperature, token_, time_start, time_end, id_power=id_power)
 
         # ================================
         # Get Power data    
@@ -1185,25 +1435,6 @@ def typical_week(id_temperature, id_power, token_, time_col_name="time"):
         del df_power['time']
         del df_power['power']
         
-        # Aggregate power data by day (sum of energy per day)
-        df_power_daily = df_power.resample('D').sum()
-
-        # ================================
-        # Merge Temperature and Power data
-        # ================================
-        try: 
-            df_DD['energy'] = df_power_daily['energy'].values.tolist()
-        except:
-            # Handle merging of data if the direct merge fails
-            df2 = df_power_daily.reset_index()
-            df2['time'] = pd.to_datetime(df2['time'])
-            df1 = df_DD
-            df1['time'] = pd.to_datetime(df1['time'])
-            
-            # Merge temperature and power dataframes on 'time'
-            merge_df = pd.merge(df1, df2, on='time', how='outer')
-            df_DD['energy'] = merge_df['energy'].values.tolist()
-        
         # ================================
         # Hourly values
         # ================================
@@ -1261,14 +1492,8 @@ def overall_analysis_buis(energy_price: float, token_, time_col_name):
         including energy usage during day and night periods, mean values, and the associated costs.
     '''
     
-    # Fetch energy meter data for all shops/buildings
-    energy_meter_shops = pd.DataFrame(get_list_energy_meters_all_shops())
-    stats_analysis = pd.DataFrame()
-
-    # Iterate through each building/shop and perform analysis
-    for i, bui in energy_meter_shops.iterrows():
-        stat_bui, df__ = get_mean_sum_count_energy_periods(bui['uuid'], bui['shops'], token_, time_col_name)
-        stats_analysis = pd.concat([stats_analysis, stat_bui])
+    # Day/night statistics of every building/shop, grouped by the API in one request
+    stats_analysis = get_energy_periods_all_shops(token_)
 
     # Pivot the data to organize it by shops and periods (day and night)
     grouped_df = stats_analysis.pivot(index="shops", columns="period", values=["sum", "mean", "count"]).reset_index()
@@ -1358,6 +1583,34 @@ def get_data_from_param(param, token_, time_manual, time_start, time_end):
         return None  # Return None if no valid start/end values are found
 
 
+def get_latest_of_sensors(id_measurements, token_):
+    '''
+    Retrieves the last time and value of several sensors with one request, served from the API latest-value cache.
+
+    Parameters:
+    -----------
+    id_measurements: List of measurement IDs.
+    token_: Authentication token for the API.
+
+    Returns:
+    --------
+    DataFrame indexed by sensor ID with the columns 'time' and 'value'.
+    '''
+    url = f"http://{url_shops}/store_data/api/v1/latest"
+    headers = {
+        "accept": "application/json",
+        "Authorization": f"Bearer {token_}"
+    }
+    params = [('sensor_id', id_measure) for id_measure in id_measurements]
+
+    response = requests.get(url, headers=headers, params=params)
+
+    df_data = pd.DataFrame(columns=['sensor_id', 'time', 'value'])
+    if response.status_code == 200 and response.json():
+        df_data = pd.DataFrame(response.json())
+    return df_data.set_index('sensor_id')
+
+
 def get_building_data_last(building_list, token_):
     '''
     Fetches the last values of indoor temperature, outdoor temperature, and HVAC power for each building in the list.
@@ -1369,10 +1622,8 @@ def get_building_data_last(building_list, token_):
     Returns:
         tuple: A tuple of three lists containing last values for indoor temperature, outdoor temperature, and HVAC power.
     '''
-    # Lists to store last values for each data type
-    external_temperatures = []
-    hvac_powers = []
-    indoor_temperature = []
+    # UUIDs of the indoor temperature, outdoor temperature and HVAC power sensors of each building
+    sensors = []
 
     # Loop through each building in the provided list
     for building in building_list:
@@ -1380,42 +1631,45 @@ def get_building_data_last(building_list, token_):
             # INDOOR TEMPERATURE
             # Get the label and UUID for indoor temperature
             ind_temp_uuid = get_temperature_label_and_uuid(building)
-            if ind_temp_uuid:
-                # Filter out sensors that mention "External" or "Outside" in their label
-                ind_temp_uuid = [item for item in ind_temp_uuid if "External" not in item['label'] and "Outside" not in item['label']]
-                # Fetch the first and last value of indoor temperature
-                df_indoor = get_first_and_last_value(ind_temp_uuid[0]['value'], token_)
-                last_ind_temp_value = round(list(df_indoor['value'])[-1], 2)  # Round the last value to 2 decimal places
-            else:
-                last_ind_temp_value = np.NaN  # Assign NaN if no indoor temperature data is available
+            # Filter out sensors that mention "External" or "Outside" in their label
+            ind_temp_uuid = [item for item in ind_temp_uuid if "External" not in item['label'] and "Outside" not in item['label']]
+            ind_temp_uuid = ind_temp_uuid[0]['value']
         except:
-            last_ind_temp_value = np.NaN  # Handle any error and assign NaN
+            ind_temp_uuid = None  # No indoor temperature sensor available
         
         try:
             # EXTERNAL TEMPERATURE
             # Get the UUID for external temperature data
             ext_temp_uuid = get_meter_label_and_uuid_weather(building)[0]['value']
-            df = get_first_and_last_value(ext_temp_uuid, token_)
-            last_temp_value = list(df['value'])[-1]  # Get the last external temperature value
         except:
-            last_temp_value = np.NaN  # Assign NaN if no external temperature data is available
+            ext_temp_uuid = None  # No external temperature sensor available
         
         try:
             # HVAC POWER: Fetch the first matching HVAC sensor
-            havc_1 = extract_values_with_keywords(get_meter_label_and_uuid(building))[0]
-            if havc_1:
-                # Fetch the first and last value of HVAC power
-                df_HVAC = get_first_and_last_value(havc_1, token_)
-                last_hvac_value = round(list(df_HVAC['value'])[-1], 2)  # Round the last HVAC value to 2 decimal places
-            else:
-                last_hvac_value = np.NaN  # Assign NaN if no HVAC data is available
+            havc_1 = extract_values_with_keywords(get_meter_label_and_uuid(building))[0] or None
         except Exception:
-            last_hvac_value = np.NaN  # Use NaN if fetching fails
-        
-        # Append the fetched values to the respective lists
-        external_temperatures.append(last_temp_value)
-        hvac_powers.append(last_hvac_value)
-        indoor_temperature.append(last_ind_temp_value)
+            havc_1 = None  # No HVAC sensor available
+
+        sensors.append((ind_temp_uuid, ext_temp_uuid, havc_1))
+
+    # Fetch the last value of every sensor of every building with a single request
+    all_uuids = [uuid_ for building_sensors in sensors for uuid_ in building_sensors if uuid_]
+    try:
+        last_values = get_latest_of_sensors(all_uuids, token_)['value'] if all_uuids else pd.Series(dtype=float)
+    except Exception:
+        last_values = pd.Series(dtype=float)
+
+    def last_value(uuid_, decimals=None):
+        # NaN if the sensor is missing or has no data
+        value = last_values.get(str(uuid_).lower()) if uuid_ else None
+        if value is None or pd.isna(value):
+            return np.NaN
+        return round(value, decimals) if decimals is not None else value
+
+    # Lists with last values for each data type
+    indoor_temperature = [last_value(ind, 2) for ind, ext, hvac in sensors]
+    external_temperatures = [last_value(ext) for ind, ext, hvac in sensors]
+    hvac_powers = [last_value(hvac, 2) for ind, ext, hvac in sensors]
 
     # Return the lists with last values for each data type
-    return indoor_temperature, external_temperatures, hvac_powers
\ No newline at end of file
+    return indoor_temperature, external_temperatures, hvac_powers
@@ -1,5 +1,7 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Union
+import time
 
 from fastapi import Depends, HTTPException, status
 from jose import JWTError, jwt
@@ -11,7 +13,7 @@ from fastapi.security.http import HTTPAuthorizationCredentials, HTTPBearer
 import typing as t
 import os
 
-from app.definitions import APP_CLIENTID, APP_SECRET
+from app.definitions import APP_CLIENTID, APP_SECRET, APP_SECRET_HASH, TOKEN_CACHE_SIZE
 
 # to get a string like this run:
 # openssl rand -hex 32
@@ -26,13 +28,13 @@ class User():
 
 
 def find_user(clientid: str):
-    if clientid == APP_CLIENTID:
-        user = User()
-        user.clientid = APP_CLIENTID
-        user.secret = get_password_hash(APP_SECRET)
-        return user
-    else:
+    secret = credentials.get(clientid)
+    if secret is None:
         return None
+    user = User()
+    user.clientid = clientid
+    user.secret = secret
+    return user
 
 
 #########################################################################################
@@ -61,6 +63,52 @@ def get_password_hash(password):
     return generate_password_hash(password, method='scrypt')
 
 
+def load_credentials() -> dict:
+    '''
+    Return the hashed secret of each client. The secret is hashed once here,
+    not on every request: scrypt is deliberately expensive.
+    '''
+    if not APP_CLIENTID:
+        return {}
+    return {APP_CLIENTID: APP_SECRET_HASH or get_password_hash(APP_SECRET)}
+
+
+credentials = load_credentials()
+
+
+class TokenCache():
+    '''
+    Bounded LRU of bearer tokens already verified, mapped to their client id and
+    expiry time, so a token is decoded once instead of on every request.
+    '''
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._tokens = OrderedDict()
+
+    def get(self, token: str):
+        entry = self._tokens.get(token)
+        if entry is None:
+            return None
+        clientid, expire = entry
+        if expire <= time.time():
+            del self._tokens[token]
+            return None
+        self._tokens.move_to_end(token)
+        return clientid
+
+    def put(self, token: str, clientid: str, expire: float) -> None:
+        if self.maxsize <= 0:
+            return
+        self._tokens[token] = (clientid, expire)
+        self._tokens.move_to_end(token)
+        while len(self._tokens) > self.maxsize:
+            self._tokens.popitem(last=False)
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+
 def authenticate_user(clientid: str, secret: str):
     user = find_user(clientid)
     if not user:
@@ -89,15 +137,23 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(auth.credentials, API_SECRET_KEY, algorithms=[ALGORITHM])
-        clientid: str = payload.get("sub")
-        if clientid is None:
-            raise credentials_exception
-        token_data = TokenData(clientid=clientid)
-    except JWTError:
+    if auth is None:
         raise credentials_exception
-    user = find_user(clientid=token_data.clientid)
+
+    clientid = token_cache.get(auth.credentials)
+    if clientid is None:
+        try:
+            payload = jwt.decode(auth.credentials, API_SECRET_KEY, algorithms=[ALGORITHM])
+            clientid: str = payload.get("sub")
+            if clientid is None or payload.get("exp") is None:
+                raise credentials_exception
+            token_data = TokenData(clientid=clientid)
+        except JWTError:
+            raise credentials_exception
+        clientid = token_data.clientid
+        token_cache.put(auth.credentials, clientid, payload["exp"])
+
+    user = find_user(clientid=clientid)
     if user is None:
         raise credentials_exception
     return user
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+
+from fastapi import HTTPException
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.definitions import INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL, INGEST_MAX_QUEUE, INGEST_MAX_RETRIES
+from app.ingest import insert_measurements
+
+
+logger = logging.getLogger(__name__)
+
+
+class MeasurementBuffer():
+    '''
+    In-process write-behind queue for single measurements.
+
+    Points are kept in memory and written with one multi-row INSERT when the
+    queue reaches `batch_size` points or every `flush_interval` seconds,
+    whichever comes first. The queue holds at most `max_queue` points, and points
+    that could not be written after `max_retries` consecutive flushes are dropped.
+    '''
+
+    def __init__(self, batch_size: int, flush_interval: float, max_queue: int, max_retries: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self._points = []
+        self._failures = 0
+        self._waiters = []
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    async def put(self, points: list, wait: bool = False) -> None:
+        '''
+        Queue `points` (dicts with time, sensor_id and value). If `wait` is True,
+        return only once the batch containing them has been committed.
+        Raise a 503 if the queue is full.
+        '''
+        waiter = asyncio.get_running_loop().create_future() if wait else None
+        async with self._lock:
+            if len(self._points) + len(points) > self.max_queue:
+                raise HTTPException(status_code=503, detail="Ingest queue is full, retry later")
+            self._points.extend(points)
+            if waiter is not None:
+                self._waiters.append(waiter)
+            full = len(self._points) >= self.batch_size
+
+        if full:
+            await self.flush()
+        if waiter is not None:
+            await waiter
+
+    async def flush(self) -> None:
+        '''Write every queued point and wake up the requests waiting for them.'''
+        async with self._lock:
+            points, waiters = self._points, self._waiters
+            self._points, self._waiters = [], []
+
+        error = await self._write(points) if points else None
+
+        for waiter in waiters:
+            if waiter.done():
+                continue
+            if error is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(error)
+
+    async def _write(self, points: list) -> Exception | None:
+        '''
+        Insert a batch of queued points. If the batch holds an invalid point, the
+        points are written one by one so that only the invalid ones are dropped.
+        If the database cannot be reached, the points not written yet are queued
+        again for the next flush and the error is returned.
+        '''
+        try:
+            await insert_measurements(points)
+            self._failures = 0
+            return None
+        except (DataError, IntegrityError) as e:
+            logger.warning("Batch of %d buffered measurements rejected (%s), writing them one by one", len(points), e)
+        except Exception as e:
+            return await self._requeue(points, e)
+
+        for i, point in enumerate(points):
+            try:
+                await insert_measurements([point])
+            except (DataError, IntegrityError) as e:
+                logger.error("Dropped invalid buffered measurement %s: %s", point, e)
+            except Exception as e:
+                return await self._requeue(points[i:], e)
+        self._failures = 0
+        return None
+
+    async def _requeue(self, points: list, error: Exception) -> Exception:
+        self._failures += 1
+        if self._failures >= self.max_retries:
+            logger.error("Error flushing %d buffered measurements, dropped after %d attempts: %s",
+                         len(points), self._failures, error)
+            self._failures = 0
+            return error
+        logger.error("Error flushing %d buffered measurements, queued again: %s", len(points), error)
+        async with self._lock:
+            self._points[:0] = points
+        return error
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        '''Stop the periodic flush and write what is left in the queue.'''
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+measurement_buffer = MeasurementBuffer(INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL, INGEST_MAX_QUEUE, INGEST_MAX_RETRIES)
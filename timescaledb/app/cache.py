@@ -0,0 +1,284 @@
+import hashlib
+import json
+import time as clock
+from collections import OrderedDict
+from datetime import datetime
+
+from app.definitions import REDIS_URL, RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RESULT_CACHE_MAX_BYTES
+from app.models import naive_utc
+
+
+# Redis: keep the stored point only if the new one is more recent (ISO times sort as strings)
+# and the stored one has not expired (ARGV[3] is the current time); the hash expires after
+# ARGV[4] seconds without update
+REDIS_SET_IF_NEWER = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if current then
+    local entry = cjson.decode(current)
+    if entry['time'] >= cjson.decode(ARGV[2])['time'] and (entry['expires'] or 0) >= tonumber(ARGV[3]) then
+        return 0
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+class LatestValueCache():
+    '''
+    Last (time, value) of each sensor, updated by every write path of the API so
+    that the latest values can be read without touching the hypertable.
+
+    Entries are kept in a dict of the process, or in a Redis hash shared by all
+    the workers when `redis_url` is given. Sensors missing from the cache are read
+    from the database by the caller and stored with `update`. Entries expire after
+    `ttl` seconds, which bounds staleness from writes made outside the API (another
+    worker without Redis, psql, retention or drop_chunks).
+    '''
+
+    def __init__(self, ttl: int, redis_url: str | None = None, key: str = "store_data:latest"):
+        self.ttl = ttl
+        self.key = key
+        self._values = {}
+        self._redis = None
+        if redis_url:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(redis_url)
+            self._set_if_newer = self._redis.register_script(REDIS_SET_IF_NEWER)
+
+    async def get_many(self, sensor_ids: list) -> dict:
+        '''Return {sensor_id: {"time", "value"}} for the cached sensors among `sensor_ids`.'''
+        now = clock.time()
+        if self._redis is None:
+            return {
+                s: {"time": self._values[s]["time"], "value": self._values[s]["value"]}
+                for s in sensor_ids if s in self._values and self._values[s]["expires"] >= now
+            }
+        if not sensor_ids:
+            return {}
+        entries = await self._redis.hmget(self.key, sensor_ids)
+        return {
+            s: {"time": datetime.fromisoformat(entry["time"]), "value": entry["value"]}
+            for s, entry in ((s, json.loads(e)) for s, e in zip(sensor_ids, entries) if e is not None)
+            if entry.get("expires", 0) >= now
+        }
+
+    async def update(self, points: list) -> None:
+        '''Store the points (dicts with time, sensor_id and value) more recent than the cached ones.'''
+        latest = {}
+        for point in points:
+            sensor_id, time = str(point["sensor_id"]).lower(), naive_utc(point["time"])
+            if sensor_id not in latest or time >= latest[sensor_id]["time"]:
+                latest[sensor_id] = {"time": time, "value": point["value"]}
+
+        now = clock.time()
+        for sensor_id, entry in latest.items():
+            entry["expires"] = now + self.ttl
+            if self._redis is not None:
+                value = json.dumps({"time": entry["time"].isoformat(), "value": entry["value"], "expires": entry["expires"]})
+                await self._set_if_newer(keys=[self.key], args=[sensor_id, value, now, self.ttl])
+                continue
+            current = self._values.get(sensor_id)
+            if current is None or current["expires"] < now or entry["time"] >= current["time"]:
+                self._values[sensor_id] = entry
+
+    async def invalidate(self, sensor_ids: list | None = None) -> None:
+        '''Forget the given sensors, or every sensor if None (e.g. after a bulk upload or a delete).'''
+        if self._redis is not None:
+            if sensor_ids is None:
+                await self._redis.delete(self.key)
+            elif sensor_ids:
+                await self._redis.hdel(self.key, *sensor_ids)
+        elif sensor_ids is None:
+            self._values.clear()
+        else:
+            for sensor_id in sensor_ids:
+                self._values.pop(sensor_id, None)
+
+
+latest_cache = LatestValueCache(RESULT_CACHE_TTL, REDIS_URL)
+
+
+def _overlaps(time_from: datetime | None, time_to: datetime | None, time_min: datetime | None, time_max: datetime | None) -> bool:
+    # Read range [time_from, time_to) against written range [time_min, time_max], None being unbounded
+    if time_to is not None and time_min is not None and time_min >= time_to:
+        return False
+    if time_from is not None and time_max is not None and time_max < time_from:
+        return False
+    return True
+
+
+def _isoformat(value: datetime | None) -> str | None:
+    return value.isoformat() if value is not None else None
+
+
+class ResultCache():
+    '''
+    Rendered bodies (and validator headers) of measurement reads, keyed on
+    (sensor_ids, time_from, time_to, bucket, agg), the other read options and the
+    media type, so that a repeated read is answered without touching the database.
+
+    Entries are kept in an LRU dict of the process holding at most `size` entries,
+    or in Redis (shared by all the workers) when `redis_url` is given. Bodies
+    larger than `max_bytes` are not cached. Every write path invalidates the
+    entries of the sensors it touched whose time range overlaps the written one;
+    entries also expire after `ttl` seconds, which bounds staleness from writes
+    made outside the API.
+
+    Each invalidation also bumps a write generation of the sensors: a read takes
+    it with `generation` before querying and hands it to `put`, which drops the
+    result if a write happened in between.
+    '''
+
+    def __init__(self, size: int, ttl: int, max_bytes: int, redis_url: str | None = None, prefix: str = "store_data:results"):
+        self.size = size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._redis = None
+        if redis_url and size:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(redis_url)
+
+    @staticmethod
+    def key(
+        sensor_ids: list,
+        time_from: datetime | None,
+        time_to: datetime | None,
+        bucket: str | None,
+        agg: str,
+        variant: str = "",
+        media_type: str | None = None,
+    ) -> tuple:
+        '''
+        Return the cache key of a read; `variant` holds the other options changing
+        its result, `media_type` the format of the body (None for JSON).
+        '''
+        return (
+            tuple(sorted({str(s).lower() for s in sensor_ids})),
+            naive_utc(time_from) if time_from is not None else None,
+            naive_utc(time_to) if time_to is not None else None,
+            bucket, agg, variant, media_type,
+        )
+
+    def _name(self, key: tuple) -> str:
+        return f"{self.prefix}:entry:{hashlib.sha1(repr(key).encode()).hexdigest()}"
+
+    async def generation(self, key: tuple) -> tuple:
+        '''Return the write generation of the sensors of `key`, to pass to `put`.'''
+        names = [None, *key[0]]
+        if self._redis is None:
+            return tuple(self._generations.get(name, 0) for name in names)
+        values = await self._redis.mget([self._generation_name(name) for name in names])
+        return tuple(int(value or 0) for value in values)
+
+    def _generation_name(self, sensor_id: str | None) -> str:
+        return f"{self.prefix}:generation" if sensor_id is None else f"{self.prefix}:generation:{sensor_id}"
+
+    async def get(self, key: tuple) -> tuple | None:
+        '''Return the cached (headers, body) of a read, or None.'''
+        if not self.size:
+            return None
+        if self._redis is None:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < clock.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+        headers, body = await self._redis.hmget(self._name(key), ["headers", "body"])
+        if headers is None or body is None:
+            return None
+        return json.loads(headers), body
+
+    async def put(self, key: tuple, headers: dict, body: bytes, generation: tuple) -> None:
+        '''
+        Store the headers and body of a read, unless the sensors were written since
+        `generation` was taken or the body is too large. The least recently used
+        entry is evicted if the cache is full.
+        '''
+        if not self.size or len(body) > self.max_bytes or await self.generation(key) != generation:
+            return
+        if self._redis is None:
+            self._entries[key] = (clock.monotonic() + self.ttl, dict(headers), body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+            return
+
+        # Redis evicts with its own maxmemory policy; entries and indexes expire with the TTL
+        name = self._name(key)
+        span = json.dumps([_isoformat(key[1]), _isoformat(key[2])])
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(name, mapping={"headers": json.dumps(dict(headers)), "body": body})
+            pipe.expire(name, self.ttl)
+            for sensor_id in key[0]:
+                pipe.hset(f"{self.prefix}:sensor:{sensor_id}", name, span)
+                pipe.expire(f"{self.prefix}:sensor:{sensor_id}", self.ttl)
+            await pipe.execute()
+
+    async def tee(self, key: tuple, headers: dict, generation: tuple, chunks):
+        '''Yield the chunks of a streamed body and cache it once fully sent.'''
+        body, size = [], 0
+        async for chunk in chunks:
+            yield chunk
+            if size <= self.max_bytes:
+                chunk = chunk.encode() if isinstance(chunk, str) else chunk
+                body.append(chunk)
+                size += len(chunk)
+        if size <= self.max_bytes:
+            await self.put(key, headers, b"".join(body), generation)
+
+    async def invalidate(self, sensor_ids: list | None = None, time_min: datetime | None = None, time_max: datetime | None = None) -> None:
+        '''
+        Forget the reads of the given sensors (every sensor if None) whose time range
+        overlaps [time_min, time_max] (the whole history if the bounds are None).
+        '''
+        sensor_ids = None if sensor_ids is None else {str(s).lower() for s in sensor_ids}
+        time_min = naive_utc(time_min) if time_min is not None else None
+        time_max = naive_utc(time_max) if time_max is not None else None
+
+        if self._redis is None:
+            for name in [None] if sensor_ids is None else sensor_ids:
+                self._generations[name] = self._generations.get(name, 0) + 1
+            for key in [k for k in self._entries if sensor_ids is None or sensor_ids.intersection(k[0])]:
+                if _overlaps(key[1], key[2], time_min, time_max):
+                    del self._entries[key]
+            return
+        if not self.size:
+            return
+
+        for name in [None] if sensor_ids is None else sensor_ids:
+            await self._redis.incr(self._generation_name(name))
+        if sensor_ids is None:
+            indexes = [name async for name in self._redis.scan_iter(match=f"{self.prefix}:sensor:*")]
+        else:
+            indexes = [f"{self.prefix}:sensor:{s}" for s in sensor_ids]
+        for index in indexes:
+            stale = []
+            for name, span in (await self._redis.hgetall(index)).items():
+                time_from, time_to = (datetime.fromisoformat(t) if t else None for t in json.loads(span))
+                if _overlaps(time_from, time_to, time_min, time_max):
+                    stale.append(name)
+            if stale:
+                await self._redis.delete(*stale)
+                await self._redis.hdel(index, *stale)
+
+    async def invalidate_points(self, points: list) -> None:
+        '''Forget the reads overlapping written points (dicts with time and sensor_id).'''
+        ranges = {}
+        for point in points:
+            sensor_id, time = str(point["sensor_id"]).lower(), naive_utc(point["time"])
+            low, high = ranges.get(sensor_id, (time, time))
+            ranges[sensor_id] = (min(low, time), max(high, time))
+        for sensor_id, (time_min, time_max) in ranges.items():
+            await self.invalidate([sensor_id], time_min, time_max)
+
+
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RESULT_CACHE_MAX_BYTES, REDIS_URL)
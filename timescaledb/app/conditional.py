@@ -0,0 +1,41 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request
+
+
+def validators(count: int, time_max: datetime | None, generation: int, modified_at: datetime | None, variant: str) -> dict:
+    '''
+    Return the ETag and Last-Modified headers of a measurement response.
+
+    The ETag hashes the number of rows and the last time in the requested range and
+    the write generation of the sensors together with `variant` (query string and
+    media type), so it changes with the data, updated values included, and differs
+    between representations of the same range. Last-Modified is the time of the
+    last write to the sensors, when known.
+    '''
+    digest = hashlib.sha1(f"{count}|{time_max}|{generation}|{variant}".encode()).hexdigest()
+    headers = {"ETag": f'W/"{digest}"', "Cache-Control": "private, no-cache"}
+    if modified_at is not None:
+        headers["Last-Modified"] = format_datetime(modified_at.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+    return headers
+
+
+def not_modified(request: Request, headers: dict) -> bool:
+    '''
+    True if the client copy is still valid: If-None-Match holds the ETag or, without
+    If-None-Match, the sensors were not written since If-Modified-Since.
+    '''
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or headers["ETag"] in tags or headers["ETag"].removeprefix("W/") in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or "Last-Modified" not in headers:
+        return False
+    try:
+        return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
@@ -1,9 +1,10 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 
-def get_db_config():
+def get_db_config(driver: str = "postgresql"):
     
     host = os.environ.get('POSTGRES_HOST', 'localhost')
     port = os.environ.get('POSTGRES_PORT', '25432')
@@ -11,15 +12,35 @@ def get_db_config():
     user = os.environ.get('POSTGRES_USER', 'postgres')
     password = os.environ.get('POSTGRES_PASSWORD', 'b50a8e36c91ef15f')
     
-    config = f"postgresql://{user}:{password}@{host}:{port}/{database}"
+    config = f"{driver}://{user}:{password}@{host}:{port}/{database}"
     return config
 
+
+def get_pool_config():
+    # Connection pool of each engine (per uvicorn worker)
+    return {
+        "pool_size": int(os.environ.get('DB_POOL_SIZE', 10)),
+        "max_overflow": int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        "pool_timeout": float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        "pool_recycle": int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        "pool_pre_ping": True,
+    }
+
+
 SQL_ALCHEMY_DATABASE_URL = get_db_config()
+ASYNC_SQL_ALCHEMY_DATABASE_URL = get_db_config("postgresql+asyncpg")
 
-engine = create_engine(SQL_ALCHEMY_DATABASE_URL)
+# Synchronous engine (psycopg2): schema management, COPY ingest and admin tasks,
+# always run in the threadpool
+engine = create_engine(SQL_ALCHEMY_DATABASE_URL, **get_pool_config())
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Asynchronous engine (asyncpg): queries awaited by the API routes
+async_engine = create_async_engine(ASYNC_SQL_ALCHEMY_DATABASE_URL, **get_pool_config())
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 
 Base = declarative_base()
 
@@ -29,4 +50,9 @@ def get_db():
     try: 
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
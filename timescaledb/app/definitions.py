@@ -6,3 +6,50 @@ from datetime import datetime
 
 APP_CLIENTID = os.getenv('APP_CLIENTID', '')
 APP_SECRET = os.getenv('APP_SECRET', '')
+# Pre-hashed client secret (werkzeug hash format); when set, APP_SECRET is not needed
+APP_SECRET_HASH = os.getenv('APP_SECRET_HASH', '')
+# Number of verified bearer tokens kept in memory
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 1024))
+
+
+# Number of rows fetched per round trip by the server-side cursor of streamed responses
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 10000))
+
+# Number of CSV rows parsed, validated and committed at once by the chunked ingest mode
+INGEST_CHUNK_SIZE = int(os.getenv('INGEST_CHUNK_SIZE', 100000))
+
+# Single-point ingest: 'direct' writes every point in its own transaction,
+# 'buffered' queues points in memory and writes them in batches
+INGEST_MODE = os.getenv('INGEST_MODE', 'direct')
+# A buffered batch is flushed when it reaches this size or after this many seconds
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 1000))
+INGEST_FLUSH_INTERVAL = float(os.getenv('INGEST_FLUSH_INTERVAL', 5))
+# Points a buffered queue may hold before new points are refused with a 503, and
+# consecutive failed flushes after which the queued points are dropped
+INGEST_MAX_QUEUE = int(os.getenv('INGEST_MAX_QUEUE', 100000))
+INGEST_MAX_RETRIES = int(os.getenv('INGEST_MAX_RETRIES', 5))
+# 'queued' acknowledges a buffered point as soon as it is queued,
+# 'flushed' waits until the batch containing it has been committed
+INGEST_ACK = os.getenv('INGEST_ACK', 'queued')
+
+# Storage policy of the measurement hypertable applied at startup (see /api/v1/admin/storage).
+# Compression: chunks older than COMPRESS_AFTER are compressed, segmented by sensor_id.
+# Retention: raw chunks older than RAW_RETENTION are dropped; rollups are kept.
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'false').lower() == 'true'
+COMPRESS_AFTER = os.getenv('COMPRESS_AFTER', '30 days')
+RAW_RETENTION = os.getenv('RAW_RETENTION') or None
+
+# Latest value per sensor: kept in process, or shared between workers in Redis
+# when REDIS_URL is set (e.g. redis://redis:6379/0, needs the 'redis' package)
+REDIS_URL = os.getenv('REDIS_URL') or None
+
+# Rendered results of measurement reads: number of entries kept (LRU, 0 disables
+# the cache), seconds after which an entry expires (also used by the latest-value
+# cache) and largest body cached, in bytes. Shared in Redis with REDIS_URL.
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 256))
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', 300))
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+# Sensor registry loaded at startup: {building: {label: sensor_id}}
+SENSOR_METADATA_PATH = os.getenv('SENSOR_METADATA_PATH', os.path.join(os.path.dirname(__file__), '..', 'data', 'metadata.json'))
+SENSOR_SAMPLING_INTERVAL = os.getenv('SENSOR_SAMPLING_INTERVAL', '15 minutes')
@@ -0,0 +1,60 @@
+import numpy as np
+
+import app.models as models
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    '''
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Return the sorted indices of the `points` samples of (x, y) to keep: the first
+    and last samples, plus in each of `points - 2` equal buckets the sample that
+    forms the largest triangle with the sample kept in the previous bucket and the
+    average of the next bucket. Peaks and troughs survive, unlike with a plain
+    average or every-nth-sample decimation.
+    '''
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (points - 2)
+    edges = np.floor(np.arange(points - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    kept = np.empty(points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def downsample_rows(rows: list, points: int) -> list:
+    '''
+    Keep at most `points` of the (time, sensor_id, value) rows of each sensor with
+    LTTB, in their original order. Rows without a value (empty gap-filled buckets)
+    are dropped first.
+    '''
+    series = {}
+    for i, row in enumerate(rows):
+        if row.value is not None:
+            series.setdefault(row.sensor_id, []).append(i)
+
+    kept = []
+    for indices in series.values():
+        if len(indices) <= points:
+            kept += indices
+            continue
+        x = np.array([models.naive_utc(rows[i].time) for i in indices], dtype="datetime64[us]").astype(np.float64)
+        y = np.array([rows[i].value for i in indices], dtype=np.float64)
+        kept += [indices[j] for j in lttb(x, y, points)]
+    return [rows[i] for i in sorted(kept)]
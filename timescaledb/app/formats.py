@@ -0,0 +1,133 @@
+import json
+from io import BytesIO
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.responses import Response, StreamingResponse
+
+from app.database import async_engine
+from app.definitions import STREAM_CHUNK_SIZE
+
+
+# Media types returned instead of the default JSON list
+NDJSON = "application/x-ndjson"
+CSV = "text/csv"
+ARROW = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+STREAM_FORMATS = [NDJSON, CSV, ARROW, PARQUET]
+
+# Columnar layout of the binary formats
+ARROW_SCHEMA = pa.schema([
+    ("time", pa.timestamp("us", tz="UTC")),
+    ("sensor_id", pa.string()),
+    ("value", pa.float64()),
+])
+
+
+def negotiate(accept: str | None) -> str | None:
+    '''
+    Return the media type requested through the Accept header,
+    or None when the client expects the default JSON list.
+    '''
+    if not accept:
+        return None
+    for media_type in STREAM_FORMATS:
+        if media_type in accept:
+            return media_type
+    return None
+
+
+def _ndjson_line(row) -> str:
+    return json.dumps({
+        "time": row.time.isoformat(),
+        "sensor_id": str(row.sensor_id),
+        "value": row.value,
+    }) + "\n"
+
+
+def _csv_line(row) -> str:
+    # Empty buckets of a gap-filled read have no value
+    value = "" if row.value is None else row.value
+    return f"{row.time.isoformat()},{row.sensor_id},{value}\n"
+
+
+def _record_batch(rows) -> pa.RecordBatch:
+    times, sensor_ids, values = zip(*rows)
+    return pa.RecordBatch.from_arrays([
+        pa.array(times, type=ARROW_SCHEMA.field("time").type),
+        pa.array([str(sensor_id) for sensor_id in sensor_ids], type=pa.string()),
+        pa.array(values, type=pa.float64()),
+    ], schema=ARROW_SCHEMA)
+
+
+async def _partitions(query):
+    '''
+    Yield the rows of `query` in lists of STREAM_CHUNK_SIZE, read through a
+    server-side cursor. The connection is opened here because the request
+    session is closed before the response body is sent.
+    '''
+    async with async_engine.connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=STREAM_CHUNK_SIZE))
+        async for rows in result.partitions():
+            yield rows
+
+
+async def _text_stream(query, media_type: str):
+    format_row = _ndjson_line if media_type == NDJSON else _csv_line
+    if media_type == CSV:
+        yield "time,sensor_id,value\n"
+    async for rows in _partitions(query):
+        yield "".join(format_row(row) for row in rows)
+
+
+async def _arrow_stream(query):
+    sink = BytesIO()
+    with pa.ipc.new_stream(sink, ARROW_SCHEMA) as writer:
+        async for rows in _partitions(query):
+            writer.write_batch(_record_batch(rows))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    # End-of-stream marker written when the writer is closed
+    yield sink.getvalue()
+
+
+async def _parquet_file(query) -> bytes:
+    sink = BytesIO()
+    with pq.ParquetWriter(sink, ARROW_SCHEMA) as writer:
+        async for rows in _partitions(query):
+            writer.write_batch(_record_batch(rows))
+    return sink.getvalue()
+
+
+def render_rows(rows: list, media_type: str) -> Response:
+    '''
+    Return (time, sensor_id, value) rows already read in memory, e.g. a downsampled
+    series, in one of the STREAM_FORMATS.
+    '''
+    if media_type in (NDJSON, CSV):
+        format_row = _ndjson_line if media_type == NDJSON else _csv_line
+        header = "time,sensor_id,value\n" if media_type == CSV else ""
+        return Response(header + "".join(format_row(row) for row in rows), media_type=media_type)
+
+    sink = BytesIO()
+    writer_class = pq.ParquetWriter if media_type == PARQUET else pa.ipc.new_stream
+    with writer_class(sink, ARROW_SCHEMA) as writer:
+        if rows:
+            writer.write_batch(_record_batch(rows))
+    return Response(sink.getvalue(), media_type=media_type)
+
+
+async def stream_rows(query, media_type: str) -> Response:
+    '''
+    Return the (time, sensor_id, value) rows of `query` in one of the STREAM_FORMATS.
+
+    NDJSON, CSV and Arrow IPC are streamed chunk by chunk, so memory stays flat
+    whatever the size of the range. Parquet needs its footer before it can be read,
+    so the file is built chunk by chunk (one row group per chunk) and sent at once.
+    '''
+    if media_type == PARQUET:
+        return Response(await _parquet_file(query), media_type=media_type)
+    if media_type == ARROW:
+        return StreamingResponse(_arrow_stream(query), media_type=media_type)
+    return StreamingResponse(_text_stream(query, media_type), media_type=media_type)
@@ -0,0 +1,303 @@
+import csv
+import gzip
+import io
+import zlib
+from io import StringIO
+
+import pandas as pd
+import zstandard
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from psycopg2 import DataError, IntegrityError
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database import engine, async_engine
+from app.cache import latest_cache, result_cache
+import app.models as models
+from app.definitions import INGEST_CHUNK_SIZE
+from app.queries import record_write_query
+
+
+# Columns expected in an uploaded CSV file (in any order)
+MEASUREMENT_COLUMNS = {"time", "sensor_id", "value"}
+
+UUID_PATTERN = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+
+# The staged time is a timestamptz read with the UTC time zone: offsets in the
+# file are applied and times without offset are UTC, as in the chunked path
+CREATE_STAGING = """
+    CREATE TEMP TABLE measurement_staging (
+        time TIMESTAMPTZ NOT NULL,
+        sensor_id UUID NOT NULL,
+        value DOUBLE PRECISION NOT NULL
+    ) ON COMMIT DROP
+"""
+
+# Merge the staged rows into the hypertable. Duplicates inside the file are
+# collapsed first, otherwise ON CONFLICT DO UPDATE would touch a row twice.
+# `xmax = 0` is true for freshly inserted rows and false for updated ones.
+MERGE_STAGING = {
+    "nothing": """
+        WITH merged AS (
+            INSERT INTO measurement (time, sensor_id, value)
+            SELECT DISTINCT ON (time, sensor_id) time, sensor_id, value
+            FROM measurement_staging
+            ORDER BY time, sensor_id
+            ON CONFLICT (time, sensor_id) DO NOTHING
+            RETURNING 1
+        )
+        SELECT count(*), 0 FROM merged
+    """,
+    "update": """
+        WITH merged AS (
+            INSERT INTO measurement (time, sensor_id, value)
+            SELECT DISTINCT ON (time, sensor_id) time, sensor_id, value
+            FROM measurement_staging
+            ORDER BY time, sensor_id
+            ON CONFLICT (time, sensor_id) DO UPDATE SET value = EXCLUDED.value
+            WHERE measurement.value IS DISTINCT FROM EXCLUDED.value
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+    """,
+}
+
+# Bump the write generation of the sensors of the staged rows (see models.MeasurementWrite)
+RECORD_STAGED_WRITES = """
+    INSERT INTO measurement_write (sensor_id, generation, modified_at)
+    SELECT DISTINCT sensor_id, 1, now() AT TIME ZONE 'UTC'
+    FROM measurement_staging
+    ORDER BY sensor_id
+    ON CONFLICT (sensor_id) DO UPDATE
+    SET generation = measurement_write.generation + 1, modified_at = EXCLUDED.modified_at
+"""
+
+
+# Compressed uploads: Content-Encoding of the file part, or file name suffix
+COMPRESSIONS = {
+    "gzip": [".gz", ".gzip"],
+    "zstd": [".zst", ".zstd"],
+}
+
+# Raised while reading a corrupted or truncated compressed upload
+DECOMPRESSION_ERRORS = (OSError, EOFError, zlib.error, zstandard.ZstdError)
+
+
+def upload_compression(filename: str | None, content_encoding: str | None) -> str | None:
+    '''
+    Return the compression of an uploaded file ("gzip", "zstd" or None), from the
+    Content-Encoding header of its part or else from its file name.
+    '''
+    if content_encoding and content_encoding.strip().lower() not in ("identity", ""):
+        encoding = content_encoding.strip().lower()
+        encoding = "gzip" if encoding == "x-gzip" else encoding
+        if encoding not in COMPRESSIONS:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"Content-Encoding '{content_encoding}' is not supported, use one of {list(COMPRESSIONS)}.",
+            )
+        return encoding
+    for compression, suffixes in COMPRESSIONS.items():
+        if filename and filename.lower().endswith(tuple(suffixes)):
+            return compression
+    return None
+
+
+def open_upload(file, compression: str | None):
+    '''
+    Wrap an uploaded binary file so that it is decompressed while being read:
+    the ingest functions then stream it as if it were a plain CSV file.
+    '''
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=file, mode="rb")
+    if compression == "zstd":
+        reader = zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True)
+        return io.BufferedReader(reader)
+    return file
+
+
+def read_header(file) -> list:
+    '''
+    Consume and validate the header line of an uploaded CSV file.
+    Return the column names in file order, so COPY can map them.
+    '''
+    header = file.readline().decode("utf-8-sig")
+    columns = [column.strip() for column in next(csv.reader([header]), [])]
+    if set(columns) != MEASUREMENT_COLUMNS or len(columns) != len(MEASUREMENT_COLUMNS):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"CSV columns must be 'time', 'sensor_id', 'value', got {columns}.",
+        )
+    return columns
+
+
+def _copy_and_merge(cursor, source, columns: list, on_conflict: str) -> tuple:
+    '''
+    COPY the CSV rows of `source` (without header) into a new staging table and
+    merge them into the hypertable. Return (rows, inserted, updated, time_min, time_max).
+    '''
+    cursor.execute("SET LOCAL TIME ZONE 'UTC'")
+    cursor.execute(CREATE_STAGING)
+    cursor.copy_expert(
+        f"COPY measurement_staging ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        source,
+    )
+    rows = cursor.rowcount
+    cursor.execute("SELECT min(time), max(time) FROM measurement_staging")
+    time_min, time_max = cursor.fetchone()
+    cursor.execute(MERGE_STAGING[on_conflict])
+    inserted, updated = cursor.fetchone()
+    if inserted or updated:
+        cursor.execute(RECORD_STAGED_WRITES)
+    return rows, inserted, updated, time_min, time_max
+
+
+def copy_measurements(file, on_conflict: str = "nothing") -> dict:
+    '''
+    Bulk load a CSV file of measurements with COPY FROM STDIN.
+
+    The rows are copied into a temporary staging table and merged into the
+    `measurement` hypertable with INSERT ... ON CONFLICT in the same transaction,
+    so a duplicate row no longer fails the whole upload.
+
+    Parameters:
+    -----------
+    file: binary file object positioned at the start of the CSV file.
+    on_conflict: "nothing" keeps the stored value of existing (time, sensor_id)
+        rows, "update" overwrites it with the uploaded one.
+
+    Returns:
+    --------
+    dict with the number of rows read from the file and of rows inserted,
+    updated and skipped.
+    '''
+    columns = read_header(file)
+
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            rows, inserted, updated, time_min, time_max = _copy_and_merge(cursor, file, columns, on_conflict)
+        connection.commit()
+    except (DataError, IntegrityError) as e:
+        connection.rollback()
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    finally:
+        connection.close()
+
+    if inserted or updated:
+        models.refresh_rollups(engine, time_min, time_max)
+
+    return {
+        "rows": rows,
+        "inserted": inserted,
+        "updated": updated,
+        "skipped": rows - inserted - updated,
+    }
+
+
+def _validate_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Keep the rows of a parsed CSV chunk whose time, sensor_id and value are valid.
+    '''
+    if set(chunk.columns) != MEASUREMENT_COLUMNS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"CSV columns must be 'time', 'sensor_id', 'value', got {list(chunk.columns)}.",
+        )
+    chunk = pd.DataFrame({
+        "time": pd.to_datetime(chunk["time"], errors="coerce", format="ISO8601", utc=True),
+        "sensor_id": chunk["sensor_id"].astype(str).str.strip().str.lower(),
+        "value": pd.to_numeric(chunk["value"], errors="coerce"),
+    })
+    valid = (
+        chunk["time"].notna()
+        & chunk["value"].notna()
+        & chunk["sensor_id"].str.fullmatch(UUID_PATTERN)
+    )
+    return chunk[valid]
+
+
+def copy_measurements_chunked(file, chunksize: int = INGEST_CHUNK_SIZE, on_conflict: str = "nothing") -> dict:
+    '''
+    Bulk load a CSV file of measurements while parsing it incrementally.
+
+    The file is read `chunksize` rows at a time with pandas. Each chunk is
+    validated, copied into the staging table, merged into the hypertable and
+    committed before the next one is read, so memory stays bounded whatever the
+    file size. Rows with an unparsable time, sensor_id or value are rejected and
+    counted instead of failing the whole upload.
+
+    Returns:
+    --------
+    dict with the number of rows read from the file, of rows rejected by the
+    validation, of rows inserted, updated and skipped, and of chunks committed.
+
+    If a chunk fails (parse, data or decompression error), the chunks before it
+    stay committed: the rollups are still refreshed over them and the 422 detail
+    holds the error message and the report of what was committed.
+    '''
+    report = {"rows": 0, "rejected": 0, "inserted": 0, "updated": 0, "skipped": 0, "chunks": 0}
+    columns = ["time", "sensor_id", "value"]
+    changed = []
+
+    connection = engine.raw_connection()
+    try:
+        for chunk in pd.read_csv(file, chunksize=chunksize, skipinitialspace=True):
+            chunk.columns = [column.strip() for column in chunk.columns]
+            valid = _validate_chunk(chunk)
+
+            buffer = StringIO()
+            valid.to_csv(buffer, columns=columns, index=False, header=False)
+            buffer.seek(0)
+
+            with connection.cursor() as cursor:
+                rows, inserted, updated, time_min, time_max = _copy_and_merge(cursor, buffer, columns, on_conflict)
+            connection.commit()
+            if inserted or updated:
+                changed += [time_min, time_max]
+
+            report["rows"] += len(chunk)
+            report["rejected"] += len(chunk) - len(valid)
+            report["inserted"] += inserted
+            report["updated"] += updated
+            report["skipped"] += rows - inserted - updated
+            report["chunks"] += 1
+    except (DataError, IntegrityError, pd.errors.ParserError, pd.errors.EmptyDataError, *DECOMPRESSION_ERRORS) as e:
+        connection.rollback()
+        message = f"Cannot decompress the file: {e}" if isinstance(e, DECOMPRESSION_ERRORS) else str(e)
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"message": message, "committed": report},
+        )
+    finally:
+        connection.close()
+        if changed:
+            models.refresh_rollups(engine, min(changed), max(changed))
+
+    return report
+
+
+async def insert_measurements(points: list) -> list:
+    '''
+    Write a batch of measurements in one round trip (executemany, sent by
+    SQLAlchemy as multi-row INSERTs). Points already stored for the same
+    (time, sensor_id) are ignored.
+    Return the points actually inserted, which also update the latest-value cache,
+    invalidate the cached reads of their range and refresh the rollups if they
+    reach already materialized buckets.
+    '''
+    statement = (
+        insert(models.Measurement)
+        .on_conflict_do_nothing(index_elements=["time", "sensor_id"])
+        .returning(models.Measurement.time, models.Measurement.sensor_id, models.Measurement.value)
+    )
+    async with async_engine.begin() as conn:
+        inserted = [row._asdict() for row in await conn.execute(statement, points)]
+        if inserted:
+            await conn.execute(record_write_query([point["sensor_id"] for point in inserted]))
+    await latest_cache.update(inserted)
+    await result_cache.invalidate_points(inserted)
+    if inserted:
+        times = [point["time"] for point in inserted]
+        await run_in_threadpool(models.refresh_rollups, engine, min(times), max(times))
+    return inserted
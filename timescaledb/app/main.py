@@ -1,28 +1,59 @@
-from fastapi import FastAPI, APIRouter, HTTPException, status, Depends, Response, UploadFile, Query
+from fastapi import FastAPI, APIRouter, HTTPException, status, Depends, Request, Response, UploadFile, Query, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from contextlib import asynccontextmanager
 import uvicorn
-from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from typing import Annotated, List
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy import desc
-from io import StringIO
+from datetime import datetime, timedelta, time as time_of_day
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated, List, Literal
+from sqlalchemy import desc, select, delete, update
+from sqlalchemy.exc import DataError
 
 
 from app.auth import User, Token, authenticate_user, create_access_token, get_current_user
-from app.database import get_db
-from app.schemas import Measurement
+from app.database import get_async_db
+from app.schemas import Measurement, MeasurementKey, StoragePolicy
+from app.queries import Bucket, Aggregation, Fill, measurement_query, pivot_wide, rollup_query, summary_query, latest_query, stats_query, period_query, outlier_query, degree_days_query, HEATING_MONTHS, COOLING_MONTHS, delete_range_query, delete_keys_query, drop_chunks_query, validator_query, record_write_query, sensor_query, encode_cursor, decode_cursor
+from app.formats import negotiate, stream_rows, render_rows
+from app.downsample import downsample_rows
+from app.conditional import validators, not_modified
+from app.ingest import copy_measurements, copy_measurements_chunked, insert_measurements, upload_compression, open_upload, DECOMPRESSION_ERRORS
+from app.buffer import measurement_buffer
+from app.cache import latest_cache, result_cache
+from app.definitions import INGEST_MODE, INGEST_ACK, COMPRESSION_ENABLED, COMPRESS_AFTER, RAW_RETENTION, SENSOR_METADATA_PATH, SENSOR_SAMPLING_INTERVAL
 import app.models as models
-from app.database import engine
+from app.database import engine, async_engine
 
-import pandas as pd
+import os
 
 models.Base.metadata.create_all(bind=engine)
+# Indexes added after the table was created
+for index in models.Measurement.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
+models.create_rollups(engine)
+if os.path.exists(SENSOR_METADATA_PATH):
+    models.load_sensors(engine, SENSOR_METADATA_PATH, SENSOR_SAMPLING_INTERVAL)
+# Only the policies configured through the environment are (re)applied, so that
+# the ones set with PUT /admin/storage survive a restart
+policies = tuple(name for name, enabled in [("compression", COMPRESSION_ENABLED), ("retention", RAW_RETENTION)] if enabled)
+if policies:
+    models.apply_storage_policy(engine, COMPRESS_AFTER, RAW_RETENTION, policies)
 
 
 description_API = """
 This API allows to download moderate monitoring data.
 """
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if INGEST_MODE == "buffered":
+        measurement_buffer.start()
+    yield
+    await measurement_buffer.stop()
+    await async_engine.dispose()
+
+
 app = FastAPI(
     title = "Eurac - Moderate Store Data",
     description = description_API,
@@ -37,7 +68,8 @@ app = FastAPI(
     # openapi_tags=tags_metadata
     docs_url='/store_data/api/docs',
     redoc_url='/store_data/api/redoc',
-    openapi_url='/store_data/api/openapi.json'
+    openapi_url='/store_data/api/openapi.json',
+    lifespan=lifespan
 )
 
 
@@ -70,74 +102,324 @@ async def login_for_access_token(
 # ======================================================================
 
 
-@router.post("/api/v1/measurement")
+@router.post(
+        "/api/v1/measurement",
+        description="Save one measurement. With INGEST_MODE=buffered the point is queued and written with the next batch.")
 async def create_measurement(
     current_user: Annotated[User, Depends(get_current_user)],
-    measurement: Measurement, db: Session = Depends(get_db)
+    measurement: Measurement, db: AsyncSession = Depends(get_async_db)
 ):
+    if INGEST_MODE == "buffered":
+        await measurement_buffer.put([measurement.model_dump()], wait=INGEST_ACK == "flushed")
+        return _buffered_response(1)
+
     new_measurement = models.Measurement(**measurement.model_dump())
     db.add(new_measurement)
-    db.commit()
-    db.refresh(new_measurement)
+    await db.execute(record_write_query([measurement.sensor_id]))
+    await db.commit()
+    await db.refresh(new_measurement)
+    await latest_cache.update([measurement.model_dump()])
+    await result_cache.invalidate_points([measurement.model_dump()])
+    await run_in_threadpool(models.refresh_rollups, engine, measurement.time, measurement.time)
     return new_measurement
 
 
+@router.post(
+        "/api/v1/measurement/batch",
+        description="Save a list of measurements with one multi-row insert. Points already stored are ignored. "
+                    "With INGEST_MODE=buffered the points are queued and written with the next batch.")
+async def create_measurements(
+    current_user: Annotated[User, Depends(get_current_user)],
+    measurements: List[Measurement]
+):
+    points = [measurement.model_dump() for measurement in measurements]
+    if INGEST_MODE == "buffered":
+        await measurement_buffer.put(points, wait=INGEST_ACK == "flushed")
+        return _buffered_response(len(points))
+
+    if points:
+        await insert_measurements(points)
+    return {"status": "stored", "received": len(points)}
+
+
+def _buffered_response(received: int):
+    # 'queued' points are not in the database yet: answer 202 Accepted
+    if INGEST_ACK == "flushed":
+        return {"status": "stored", "received": received}
+    return JSONResponse({"status": "queued", "received": received}, status_code=status.HTTP_202_ACCEPTED)
+
+
 @router.post(
         "/api/v1/measurements", 
-        description="Upload a CSV file and save to measurements database. Columns: 'time', 'sensor_id', 'value'.")
+        description="Upload a CSV file and save to measurements database. Columns: 'time', 'sensor_id', 'value'. "
+                    "Rows already stored are skipped ('on_conflict=nothing') or overwritten ('on_conflict=update'). "
+                    "If 'chunksize' is set, the file is parsed, validated and committed 'chunksize' rows at a time and invalid rows are rejected; "
+                    "if a chunk fails, the chunks before it stay committed and the 422 detail reports them under 'committed'. "
+                    "The file can be compressed with gzip or zstd: set the 'Content-Encoding' header of the file part, or use a '.gz' / '.zst' file name.")
 async def load_mesurements_from_file(
     current_user: Annotated[User, Depends(get_current_user)],
     file: UploadFile,
-    db: Session = Depends(get_db)
+    on_conflict: Literal["nothing", "update"] = "nothing",
+    chunksize: Annotated[int | None, Query(gt=0)] = None
 ):
-    content = file.file.read()
-    content_str = content.decode('utf-8')
-    csv_data = StringIO(content_str)
-    df = pd.read_csv(csv_data)
+    compression = upload_compression(file.filename, file.headers.get("content-encoding"))
+    source = open_upload(file.file, compression)
 
+    # COPY is blocking: run it in the threadpool so other requests keep being served
     try:
-        df.to_sql("measurement", engine, if_exists="append", index=False)
-    except IntegrityError as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
-
-    return f"{file.filename} loaded with success."
-
-
-@router.get("/api/v1/measurements")
+        if chunksize:
+            report = await run_in_threadpool(copy_measurements_chunked, source, chunksize, on_conflict)
+        else:
+            report = await run_in_threadpool(copy_measurements, source, on_conflict)
+    except DECOMPRESSION_ERRORS as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Cannot decompress the {compression} file: {e}")
+    except HTTPException as e:
+        # A failed chunked upload keeps the chunks committed before the error
+        if isinstance(e.detail, dict):
+            await _after_upload(e.detail["committed"])
+        raise
+    await _after_upload(report)
+
+    return {"message": f"{file.filename} loaded with success.", **report}
+
+
+async def _after_upload(report: dict):
+    # Uploaded rows are not listed per sensor: forget every cached value and read
+    if report["inserted"] or report["updated"]:
+        await latest_cache.invalidate()
+        await result_cache.invalidate()
+
+
+@router.get(
+        "/api/v1/measurements",
+        description="Return all the measurements. Send 'Accept: application/x-ndjson', 'text/csv', 'application/vnd.apache.arrow.stream' or 'application/vnd.apache.parquet' to receive the rows in that format instead of a JSON list. "
+                    "If 'page_size' is set, return {'data': [...], 'next_cursor': ...}; pass 'next_cursor' back as 'cursor' to read the next page.")
 async def get_all_measurements(
     current_user: Annotated[User, Depends(get_current_user)],
     limit: int | None = None,
-    db: Session = Depends(get_db)
+    page_size: Annotated[int | None, Query(gt=0)] = None,
+    cursor: str | None = None,
+    accept: Annotated[str | None, Header()] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if limit: 
-        all_measurements = db.query(models.Measurement).order_by(models.Measurement.time).limit(limit).all()
-    else: 
-        all_measurements = db.query(models.Measurement).order_by(models.Measurement.time).all()
-        
+    query = measurement_query(None, after=_after(cursor))
+    if page_size:
+        query = query.limit(page_size)
+    elif limit: 
+        query = query.limit(limit)
+
+    media_type = negotiate(accept)
+    if media_type:
+        return await stream_rows(query, media_type)
+
+    if page_size:
+        return _page((await db.execute(query.limit(page_size + 1))).all(), page_size)
+
+    all_measurements = [dict(row) for row in (await db.execute(query)).mappings()]
     return all_measurements
 
 
-@router.get("/api/v1/measurements/{sensor_id}")
+def _after(cursor: str | None):
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+
+def _check_fill(fill: str, bucket: str | None, time_from: datetime | None, time_to: datetime | None, page_size: int | None = None, cursor: str | None = None):
+    # The regular grid of a gap-filled read spans [time_from, time_to) in steps of bucket
+    if fill == "none":
+        return
+    if bucket is None or time_from is None or time_to is None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="'fill' needs 'bucket', 'time_from' and 'time_to'.")
+    # A page cursor cannot resume a gap-filled grid, so gap-filled reads are not paged
+    if page_size is not None or cursor is not None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="'fill' cannot be combined with 'page_size' or 'cursor'.")
+
+
+def _check_points(points: int | None, page_size: int | None, cursor: str | None):
+    # A downsample is computed over the whole range, it cannot be paged
+    if points is not None and (page_size is not None or cursor is not None):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="'points' cannot be combined with 'page_size' or 'cursor'.")
+
+
+def _page(rows: list, page_size: int) -> dict:
+    # One row more than the page is fetched to know if there is a next page
+    data = [row._asdict() for row in rows[:page_size]]
+    next_cursor = encode_cursor(rows[page_size - 1].time, rows[page_size - 1].sensor_id) if len(rows) > page_size else None
+    return {"data": data, "next_cursor": next_cursor}
+
+
+async def _cached_response(request: Request, key: tuple) -> Response | None:
+    # Reads already made since the last write are answered without touching the database
+    cached = await result_cache.get(key)
+    if cached is None:
+        return None
+    headers, body = cached
+    if not_modified(request, headers):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type=key[-1] or "application/json", headers=headers)
+
+
+async def _cache_response(key: tuple, generation: tuple, response: Response, headers: dict) -> Response:
+    # Streamed bodies are cached once fully sent
+    response.headers.update(headers)
+    if isinstance(response, StreamingResponse):
+        response.body_iterator = result_cache.tee(key, headers, generation, response.body_iterator)
+    else:
+        await result_cache.put(key, headers, response.body, generation)
+    return response
+
+
+@router.get(
+        "/api/v1/measurements/wide",
+        description="Return the measurements of several sensors in one table aligned on time: one 'time' column plus one column per sensor. "
+                    "With 'fill', every bucket between 'time_from' and 'time_to' is returned: empty ('null'), with the last value carried forward ('locf') or interpolated ('linear').")
+async def get_measurements_wide(
+    current_user: Annotated[User, Depends(get_current_user)],
+    request: Request,
+    sensor_id: Annotated[List[str], Query()],
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    bucket: Bucket | None = None,
+    agg: Aggregation = "mean",
+    fill: Fill = "none",
+    db: AsyncSession = Depends(get_async_db)
+):
+    _check_fill(fill, bucket, time_from, time_to)
+    sensor_ids = list(dict.fromkeys(s.lower() for s in sensor_id))
+
+    # The column order follows the request, so it is part of the key
+    cache_key = result_cache.key(sensor_ids, time_from, time_to, bucket, agg, f"wide|{fill}|{','.join(sensor_ids)}")
+    cached = await _cached_response(request, cache_key)
+    if cached is not None:
+        return cached
+    generation = await result_cache.generation(cache_key)
+
+    validator = (await db.execute(validator_query(sensor_ids, time_from, time_to))).one()
+    headers = validators(*validator, request.url.query)
+    if not_modified(request, headers):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    query = measurement_query(sensor_ids, time_from, time_to, bucket, agg, fill=fill)
+    wide = await run_in_threadpool(pivot_wide, (await db.execute(query)).all(), sensor_ids)
+    return await _cache_response(cache_key, generation, JSONResponse(jsonable_encoder(wide)), headers)
+
+
+@router.get(
+        "/api/v1/measurements/summary",
+        description="Return first time, last time, last value and number of measurements of several sensors (repeat 'sensor_id'), or of every sensor if none is given.")
+async def get_measurements_summary(
+    current_user: Annotated[User, Depends(get_current_user)],
+    sensor_id: Annotated[List[str] | None, Query()] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    sensor_ids = list(dict.fromkeys(s.lower() for s in sensor_id)) if sensor_id else None
+
+    summary = [dict(row) for row in (await db.execute(summary_query(sensor_ids))).mappings()]
+    return summary
+
+
+@router.get(
+        "/api/v1/latest",
+        description="Return the last time and value of several sensors (repeat 'sensor_id'). Served from the latest-value cache, sensors not cached yet are read from the database.")
+async def get_latest(
+    current_user: Annotated[User, Depends(get_current_user)],
+    sensor_id: Annotated[List[str], Query()],
+    db: AsyncSession = Depends(get_async_db)
+):
+    sensor_ids = list(dict.fromkeys(s.lower() for s in sensor_id))
+
+    latest = await latest_cache.get_many(sensor_ids)
+    missing = [s for s in sensor_ids if s not in latest]
+    if missing:
+        rows = (await db.execute(latest_query(missing))).all()
+        points = [{"time": row.time, "sensor_id": str(row.sensor_id), "value": row.value} for row in rows if row.time is not None]
+        await latest_cache.update(points)
+        latest.update({point["sensor_id"]: point for point in points})
+
+    return [
+        {"sensor_id": s, "time": latest[s]["time"] if s in latest else None, "value": latest[s]["value"] if s in latest else None}
+        for s in sensor_ids
+    ]
+
+
+@router.get(
+        "/api/v1/measurements/{sensor_id}",
+        description="Return the measurements of a sensor. If 'bucket' is set, values are aggregated in the database with 'agg' over buckets of that width. "
+                    "Send 'Accept: application/x-ndjson', 'text/csv', 'application/vnd.apache.arrow.stream' or 'application/vnd.apache.parquet' to receive the rows in that format instead of a JSON list. "
+                    "If 'page_size' is set, return {'data': [...], 'next_cursor': ...}; pass 'next_cursor' back as 'cursor' to read the next page. "
+                    "With 'fill', every bucket between 'time_from' and 'time_to' is returned: empty ('null'), with the last value carried forward ('locf') or interpolated ('linear'). "
+                    "With 'points', at most that many rows are returned, selected with Largest-Triangle-Three-Buckets so that peaks and troughs are kept (e.g. points=2000 for a chart).")
 async def get_measurements(
     current_user: Annotated[User, Depends(get_current_user)],
+    request: Request,
     sensor_id: str,
     time_from: datetime | None = None, 
     time_to: datetime | None = None,
     limit: int | None = None,
-    db: Session = Depends(get_db)
+    bucket: Bucket | None = None,
+    agg: Aggregation = "mean",
+    fill: Fill = "none",
+    points: Annotated[int | None, Query(ge=3)] = None,
+    page_size: Annotated[int | None, Query(gt=0)] = None,
+    cursor: str | None = None,
+    accept: Annotated[str | None, Header()] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(models.Measurement).filter(models.Measurement.sensor_id == sensor_id)
-    if time_from is not None:
-        query = query.filter(models.Measurement.time >= time_from)
-    if time_to is not None:
-        query = query.filter(models.Measurement.time < time_to)
-    
-    if limit: 
-        measurements = query.order_by(models.Measurement.time).limit(limit).all()
-    else: 
-        measurements = query.order_by(models.Measurement.time).all()
-            
-    return measurements
+    _check_fill(fill, bucket, time_from, time_to, page_size, cursor)
+    _check_points(points, page_size, cursor)
+    query = measurement_query([sensor_id], time_from, time_to, bucket, agg, after=_after(cursor), fill=fill)
+    if page_size:
+        query = query.limit(page_size)
+    elif limit: 
+        query = query.limit(limit)
+
+    media_type = negotiate(accept)
+    cache_key = result_cache.key([sensor_id], time_from, time_to, bucket, agg, f"{fill}|{limit}|{points}|{page_size}|{cursor}", media_type)
+    cached = await _cached_response(request, cache_key)
+    if cached is not None:
+        return cached
+    generation = await result_cache.generation(cache_key)
+
+    # Conditional GET: unchanged ranges are answered with 304 without reading them
+    validator = (await db.execute(validator_query([sensor_id], time_from, time_to))).one()
+    headers = validators(*validator, f"{request.url.query}|{media_type}")
+    if not_modified(request, headers):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if points:
+        rows = await run_in_threadpool(downsample_rows, (await db.execute(query)).all(), points)
+        if media_type:
+            return await _cache_response(cache_key, generation, render_rows(rows, media_type), headers)
+        measurements = [row._asdict() for row in rows]
+    elif media_type:
+        return await _cache_response(cache_key, generation, await stream_rows(query, media_type), headers)
+    elif page_size:
+        measurements = _page((await db.execute(query.limit(page_size + 1))).all(), page_size)
+    else:
+        measurements = [dict(row) for row in (await db.execute(query)).mappings()]
+
+    return await _cache_response(cache_key, generation, JSONResponse(jsonable_encoder(measurements)), headers)
+
+
+@router.get(
+        "/api/v1/rollups/{resolution}/{sensor_id}",
+        description="Return the hourly or daily rollup of a sensor: mean, min, max, sum and count of the values of each bucket.")
+async def get_rollup(
+    current_user: Annotated[User, Depends(get_current_user)],
+    resolution: Literal["hourly", "daily"],
+    sensor_id: str,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    query = rollup_query(resolution, [sensor_id], time_from, time_to)
+
+    rollup = [dict(row) for row in (await db.execute(query)).mappings()]
+    return rollup
 
 
 @router.get("/api/v1/measurements/{sensor_id}/summary",
@@ -146,10 +428,11 @@ async def get_measurements(
 async def get_measurements(
     current_user: Annotated[User, Depends(get_current_user)],
     sensor_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    first = db.query(models.Measurement).filter(models.Measurement.sensor_id == sensor_id).order_by(models.Measurement.time).limit(1).first()
-    last = db.query(models.Measurement).filter(models.Measurement.sensor_id == sensor_id).order_by(desc(models.Measurement.time)).limit(1).first()
+    query = select(models.Measurement).where(models.Measurement.sensor_id == sensor_id)
+    first = (await db.scalars(query.order_by(models.Measurement.time).limit(1))).first()
+    last = (await db.scalars(query.order_by(desc(models.Measurement.time)).limit(1))).first()
     
     measurements = [
         first,
@@ -158,46 +441,331 @@ async def get_measurements(
     return measurements
 
 
-@router.delete("/api/v1/measurement/{sensor_id}")
+@router.get(
+        "/api/v1/measurements/{sensor_id}/stats",
+        description="Return count, min, max, mean, median and the requested percentiles (repeat 'percentile', between 0 and 1) of a sensor, "
+                    "over the whole time range and over the values whose time of day (UTC) is between 'window_start' and 'window_end' (wrapping around midnight if 'window_start' is later, e.g. 22:00-06:00).")
+async def get_measurements_stats(
+    current_user: Annotated[User, Depends(get_current_user)],
+    sensor_id: str,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    percentile: Annotated[List[float], Query(ge=0, le=1)] = [],
+    window_start: time_of_day = time_of_day(8),
+    window_end: time_of_day = time_of_day(18),
+    db: AsyncSession = Depends(get_async_db)
+):
+    percentiles = list(dict.fromkeys(percentile))
+    query = stats_query(sensor_id, time_from, time_to, percentiles, (window_start, window_end))
+    row = (await db.execute(query)).one()._asdict()
+
+    def statistics(prefix: str) -> dict:
+        stats = {name: row[prefix + name] for name in ["count", "min", "max", "mean", "median"]}
+        stats["percentiles"] = {str(p): row[f"{prefix}p{i}"] for i, p in enumerate(percentiles)}
+        return stats
+
+    return {
+        "sensor_id": sensor_id,
+        **statistics(""),
+        "window": {"start": window_start, "end": window_end, **statistics("window_")},
+    }
+
+
+@router.delete(
+        "/api/v1/measurement/{sensor_id}",
+        description="Delete the measurements of a sensor. If 'time_from' or 'time_to' is set, delete only the measurements "
+                    "in [time_from, time_to) with one statement and return the number of deleted rows.")
 async def delete_measurement(
     current_user: Annotated[User, Depends(get_current_user)],
-    sensor_id: str, db: Session = Depends(get_db)
+    sensor_id: str,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    delete_post = db.query(models.Measurement).filter(models.Measurement.sensor_id == sensor_id)
-    if delete_post.first() == None:
+    if time_from is not None or time_to is not None:
+        deleted = (await db.execute(delete_range_query([sensor_id], time_from, time_to))).one()
+        if deleted.count:
+            await db.execute(record_write_query([sensor_id]))
+        await db.commit()
+        await _after_write([sensor_id.lower()], deleted.time_min, deleted.time_max)
+        return {"deleted": deleted.count}
+
+    deleted = (await db.execute(delete_range_query([sensor_id]))).one()
+    if deleted.count == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="no matching item was found")
     else:
-        delete_post.delete(synchronize_session=False)
-        db.commit()
+        await db.execute(record_write_query([sensor_id]))
+        await db.commit()
+        await _after_write([sensor_id.lower()], deleted.time_min, deleted.time_max)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @router.delete("/api/v1/measurement/{sensor_id}/{time}")
 async def delete_measurement(
     current_user: Annotated[User, Depends(get_current_user)],
-    sensor_id: str, time: datetime, db: Session = Depends(get_db)
+    sensor_id: str, time: datetime, db: AsyncSession = Depends(get_async_db)
 ):
-    delete_post = db.query(models.Measurement).filter(models.Measurement.sensor_id == sensor_id).filter(models.Measurement.time == time)
-    if delete_post.first() == None:
+    delete_post = await db.execute(
+        delete(models.Measurement).where(models.Measurement.sensor_id == sensor_id).where(models.Measurement.time == time))
+    if delete_post.rowcount == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="no matching item was found")
     else:
-        delete_post.delete(synchronize_session=False)
-        db.commit()
+        await db.execute(record_write_query([sensor_id]))
+        await db.commit()
+        await _after_write([sensor_id.lower()], time, time)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+@router.post(
+        "/api/v1/measurement/delete",
+        description="Delete a list of measurements identified by 'sensor_id' and 'time' with one statement. Return the number of deleted rows.")
+async def delete_measurements(
+    current_user: Annotated[User, Depends(get_current_user)],
+    keys: List[MeasurementKey],
+    db: AsyncSession = Depends(get_async_db)
+):
+    if not keys:
+        return {"requested": 0, "deleted": 0}
+
+    deleted = (await db.execute(delete_keys_query([(key.sensor_id, key.time) for key in keys]))).one()
+    if deleted.count:
+        await db.execute(record_write_query([key.sensor_id for key in keys]))
+    await db.commit()
+    await _after_write(list({str(key.sensor_id) for key in keys}), deleted.time_min, deleted.time_max)
+    return {"requested": len(keys), "deleted": deleted.count}
+
+
+@router.delete(
+        "/api/v1/measurements",
+        description="Delete the measurements of every sensor in [time_from, time_to). Chunks lying entirely in the range are dropped "
+                    "instead of being deleted row by row. Return the number of deleted rows (outside dropped chunks) and of dropped chunks.")
+async def delete_measurements_range(
+    current_user: Annotated[User, Depends(get_current_user)],
+    time_from: datetime,
+    time_to: datetime,
+    db: AsyncSession = Depends(get_async_db)
+):
+    dropped = (await db.execute(drop_chunks_query(time_from, time_to))).scalar()
+    deleted = (await db.execute(delete_range_query(None, time_from, time_to))).one()
+    if dropped or deleted.count:
+        await db.execute(record_write_query(None))
+    await db.commit()
+
+    if dropped:
+        await _after_write(None, models.naive_utc(time_from), models.naive_utc(time_to))
+    else:
+        await _after_write(None, deleted.time_min, deleted.time_max)
+    return {"deleted": deleted.count, "dropped_chunks": dropped}
+
+
+async def _after_write(sensor_ids: List[str] | None, time_min: datetime | None, time_max: datetime | None):
+    # Deleted or updated rows must be reflected in the rollups, the latest-value cache and the cached reads
+    if time_min is not None:
+        await run_in_threadpool(models.refresh_rollups, engine, time_min, time_max)
+        await result_cache.invalidate(sensor_ids, time_min, time_max)
+    await latest_cache.invalidate(sensor_ids)
+
+
 @router.put("/api/v1/measurement/{identifier}/{time}")
 async def update_measurement(
     current_user: Annotated[User, Depends(get_current_user)],
-    sensor_id: str, time: datetime, measurement: Measurement, db: Session=Depends(get_db)
+    sensor_id: str, time: datetime, measurement: Measurement, db: AsyncSession=Depends(get_async_db)
 ):
-    updated_post = db.query(models.Measurement).filter(models.Measurement.sensor_id == sensor_id).filter(models.Measurement.time == time)
-    if updated_post.first() == None: 
+    filters = (models.Measurement.sensor_id == sensor_id, models.Measurement.time == time)
+    updated_post = await db.execute(update(models.Measurement).where(*filters).values(**measurement.model_dump()))
+    if updated_post.rowcount == 0: 
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="no matching item was found")
     else:
-        updated_post.update(measurement.model_dump(), synchronize_session=False)
-        db.commit()
-    return updated_post.first()
+        await db.execute(record_write_query([sensor_id, measurement.sensor_id]))
+        await db.commit()
+        times = [models.naive_utc(time), models.naive_utc(measurement.time)]
+        await _after_write([sensor_id.lower(), str(measurement.sensor_id)], min(times), max(times))
+    return (await db.scalars(select(models.Measurement).where(*filters))).first()
+
+
+# ======================================================================
+#                             SENSORS 
+# ======================================================================
+
+
+@router.get(
+        "/api/v1/sensors", tags = ['Sensors'],
+        description="Return the registered sensors (UUID, building, zone, kind, unit, label, sampling interval), filtered by building, kind and zone.")
+async def get_sensors(
+    current_user: Annotated[User, Depends(get_current_user)],
+    building: str | None = None,
+    kind: str | None = None,
+    zone: str | None = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    sensors = [dict(row) for row in (await db.execute(sensor_query(building, kind, zone))).mappings()]
+    return sensors
+
+
+@router.get(
+        "/api/v1/buildings/{building}/measurements", tags = ['Sensors'],
+        description="Return the measurements of every registered sensor of a building, optionally of one kind (e.g. 'indoor_temperature') or zone, "
+                    "with one query joined on the sensor registry. Same options and formats as /api/v1/measurements/{sensor_id}, 'points' applies to each sensor.")
+async def get_building_measurements(
+    current_user: Annotated[User, Depends(get_current_user)],
+    building: str,
+    kind: str | None = None,
+    zone: str | None = None,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    limit: int | None = None,
+    bucket: Bucket | None = None,
+    agg: Aggregation = "mean",
+    fill: Fill = "none",
+    points: Annotated[int | None, Query(ge=3)] = None,
+    accept: Annotated[str | None, Header()] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    _check_fill(fill, bucket, time_from, time_to)
+    sensor_ids = sensor_query(building, kind, zone).with_only_columns(models.Sensor.sensor_id).order_by(None)
+    query = measurement_query(sensor_ids, time_from, time_to, bucket, agg, fill=fill)
+    if limit:
+        query = query.limit(limit)
+
+    media_type = negotiate(accept)
+    if points:
+        rows = await run_in_threadpool(downsample_rows, (await db.execute(query)).all(), points)
+        return render_rows(rows, media_type) if media_type else [row._asdict() for row in rows]
+    if media_type:
+        return await stream_rows(query, media_type)
+
+    measurements = [dict(row) for row in (await db.execute(query)).mappings()]
+    return measurements
+
+
+@router.get(
+        "/api/v1/buildings/{building}/measurements/wide", tags = ['Sensors'],
+        description="Return the measurements of the registered sensors of a building, optionally of one kind or zone, in one table aligned on time: "
+                    "one 'time' column plus one column per sensor UUID. Same options as /api/v1/measurements/wide.")
+async def get_building_measurements_wide(
+    current_user: Annotated[User, Depends(get_current_user)],
+    building: str,
+    kind: str | None = None,
+    zone: str | None = None,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    bucket: Bucket | None = None,
+    agg: Aggregation = "mean",
+    fill: Fill = "none",
+    db: AsyncSession = Depends(get_async_db)
+):
+    _check_fill(fill, bucket, time_from, time_to)
+    sensor_ids = [str(s) for s in (await db.scalars(
+        sensor_query(building, kind, zone).with_only_columns(models.Sensor.sensor_id)))]
+    if not sensor_ids:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"no sensor registered for building '{building}'")
+
+    query = measurement_query(sensor_ids, time_from, time_to, bucket, agg, fill=fill)
+    return await run_in_threadpool(pivot_wide, (await db.execute(query)).all(), sensor_ids)
+
+
+# ======================================================================
+#                             ANALYSIS 
+# ======================================================================
+
+
+@router.get(
+        "/api/v1/energy/periods", tags = ['Analysis'],
+        description="Return sum, mean and count of the values of several sensors (repeat 'sensor_id') during opening hours "
+                    "(hour of the UTC time between 'opening_from' and 'opening_to', both included) and closing hours, optionally per month.")
+async def get_energy_periods(
+    current_user: Annotated[User, Depends(get_current_user)],
+    sensor_id: Annotated[List[str], Query()],
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    opening_from: Annotated[int, Query(ge=0, le=23)] = 7,
+    opening_to: Annotated[int, Query(ge=0, le=23)] = 20,
+    by_month: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    sensor_ids = list(dict.fromkeys(s.lower() for s in sensor_id))
+    query = period_query(sensor_ids, time_from, time_to, (opening_from, opening_to), by_month)
+
+    periods = [dict(row) for row in (await db.execute(query)).mappings()]
+    return periods
+
+
+@router.get(
+        "/api/v1/degree_days/{sensor_id}", tags = ['Analysis'],
+        description="Return the daily mean temperature of an outdoor temperature sensor with its heating (HDD) and cooling (CDD) degree days, "
+                    "computed from the daily rollup. HDD = max(0, heating_base - mean) in 'heating_months', CDD = max(0, mean - cooling_base) in 'cooling_months'. "
+                    "If 'power_sensor_id' is given, the daily energy of that sensor (daily sum of the power times 'energy_factor' hours) is added and only days with both are returned.")
+async def get_degree_days(
+    current_user: Annotated[User, Depends(get_current_user)],
+    sensor_id: str,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    heating_base: float = 18,
+    cooling_base: float = 26,
+    heating_months: Annotated[List[int], Query(ge=1, le=12)] = HEATING_MONTHS,
+    cooling_months: Annotated[List[int], Query(ge=1, le=12)] = COOLING_MONTHS,
+    power_sensor_id: str | None = None,
+    energy_factor: Annotated[float, Query(gt=0)] = 0.25,
+    db: AsyncSession = Depends(get_async_db)
+):
+    query = degree_days_query(
+        sensor_id, time_from, time_to, heating_base, cooling_base,
+        heating_months, cooling_months, power_sensor_id, energy_factor,
+    )
+
+    degree_days = [dict(row) for row in (await db.execute(query)).mappings()]
+    return degree_days
+
+
+@router.get(
+        "/api/v1/outliers", tags = ['Analysis'],
+        description="Return only the measurements of several sensors (repeat 'sensor_id') whose z-score is above 'threshold' in absolute value, "
+                    "with the mean and standard deviation they were compared with. Without 'window' the z-score is computed over the whole time range of each sensor; "
+                    "with 'window' it is rolling, over the 'window' previous measurements of the sensor.")
+async def get_outliers(
+    current_user: Annotated[User, Depends(get_current_user)],
+    sensor_id: Annotated[List[str], Query()],
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    window: Annotated[int | None, Query(ge=2)] = None,
+    threshold: Annotated[float, Query(gt=0)] = 3.0,
+    db: AsyncSession = Depends(get_async_db)
+):
+    sensor_ids = list(dict.fromkeys(s.lower() for s in sensor_id))
+    query = outlier_query(sensor_ids, time_from, time_to, window, threshold)
+
+    outliers = [dict(row) for row in (await db.execute(query)).mappings()]
+    return outliers
+
+
+# ======================================================================
+#                             ADMIN 
+# ======================================================================
+
+
+@router.get(
+        "/api/v1/admin/storage", tags = ['Admin'],
+        description="Return the compression and retention policies of the measurement hypertable.")
+async def get_storage_policy(
+    current_user: Annotated[User, Depends(get_current_user)]
+):
+    return await run_in_threadpool(models.get_storage_policy, engine)
+
+
+@router.put(
+        "/api/v1/admin/storage", tags = ['Admin'],
+        description="Set the compression and retention policies of the measurement hypertable. "
+                    "Intervals are PostgreSQL intervals (e.g. '30 days'); null removes the policy. "
+                    "Retention drops raw chunks only, the hourly and daily rollups are kept.")
+async def set_storage_policy(
+    current_user: Annotated[User, Depends(get_current_user)],
+    policy: StoragePolicy
+):
+    try:
+        await run_in_threadpool(models.apply_storage_policy, engine, policy.compress_after, policy.retention)
+    except (ValueError, DataError) as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    return await run_in_threadpool(models.get_storage_policy, engine)
 
 
 app.include_router(router)
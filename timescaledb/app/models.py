@@ -1,7 +1,33 @@
-from sqlalchemy import Column, Double, ForeignKey, DateTime, event, DDL, UUID, UniqueConstraint
+from sqlalchemy import Column, Double, ForeignKey, DateTime, event, DDL, UUID, UniqueConstraint, Index, BigInteger, String, Interval, text, table, column, TypeDecorator
+from sqlalchemy.dialects.postgresql import insert
+from datetime import datetime, timedelta, timezone
+import json
+import re
 from app.database import Base
 
 
+def naive_utc(value: datetime) -> datetime:
+    '''Convert an aware datetime to the naive UTC datetime stored in the database.'''
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class UTCDateTime(TypeDecorator):
+    '''
+    `timestamp without time zone` holding UTC times.
+    Aware datetimes are converted to naive UTC before being sent: psycopg2 lets
+    PostgreSQL cast them, asyncpg refuses them for this column type.
+    '''
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, datetime):
+            value = naive_utc(value)
+        return value
+
+
 # class Store(Base):
 #     __tablename__ = "store"
 
@@ -17,10 +43,14 @@ from app.database import Base
 class Measurement(Base):
     __tablename__ = "measurement"
 
-    time = Column(DateTime, primary_key=True, nullable=False)
+    time = Column(UTCDateTime, primary_key=True, nullable=False)
     sensor_id = Column(UUID, primary_key=True, nullable=False)
     value = Column(Double, nullable=False)
-    __table_args__ = (UniqueConstraint('time', 'sensor_id', name='_time_sensor_id'),)
+    __table_args__ = (
+        UniqueConstraint('time', 'sensor_id', name='_time_sensor_id'),
+        # Serves per-sensor range scans and first/last lookups
+        Index('ix_measurement_sensor_id_time', sensor_id, time.desc()),
+    )
 
 event.listen(
     Measurement.__table__,
@@ -29,3 +59,297 @@ event.listen(
 )
 
 
+class Sensor(Base):
+    __tablename__ = "sensor"
+
+    sensor_id = Column(UUID, primary_key=True, nullable=False)
+    building = Column(String, nullable=False)
+    zone = Column(String)
+    kind = Column(String, nullable=False)
+    unit = Column(String)
+    label = Column(String)
+    sampling_interval = Column(Interval)
+    __table_args__ = (
+        # Serves building-level reads ("all indoor temperatures of BCFT")
+        Index('ix_sensor_building_kind', building, kind),
+    )
+
+
+class MeasurementWrite(Base):
+    '''
+    Write generation of each sensor, bumped in the transaction of every write to
+    its measurements (insert, upload, update or delete). Validators of cached
+    reads are built from it, since a changed value leaves count and times as is.
+    '''
+    __tablename__ = "measurement_write"
+
+    sensor_id = Column(UUID, primary_key=True, nullable=False)
+    generation = Column(BigInteger, nullable=False)
+    modified_at = Column(UTCDateTime, nullable=False)
+
+
+# Kind of a sensor from the name in its metadata label
+SENSOR_KINDS = {
+    "internal temperature": "indoor_temperature",
+    "external temperature": "outdoor_temperature",
+    "hvac power": "hvac_power",
+    "global power": "global_power",
+}
+
+UNITS = {
+    "celsius degree": "°C",
+}
+
+# "<name>[ area <n>] (<unit>)", e.g. "Internal temperature area 1 (Celsius degree)"
+LABEL_PATTERN = re.compile(r"^(?P<name>.*?)(?: (?P<zone>area \d+))?\s*(?:\((?P<unit>[^)]*)\))?$")
+
+
+def parse_sensor_label(label: str) -> dict:
+    '''Return the kind, zone and unit of a sensor from its metadata label.'''
+    match = LABEL_PATTERN.match(label.strip())
+    name = match["name"].strip().lower()
+    unit = (match["unit"] or "").strip()
+    return {
+        "kind": SENSOR_KINDS.get(name, re.sub(r"\W+", "_", name).strip("_")),
+        "zone": match["zone"],
+        "unit": UNITS.get(unit.lower(), unit) or None,
+    }
+
+
+def load_sensors(bind, path: str, sampling_interval: str | None = None) -> int:
+    '''
+    Insert or update the sensor registry from a metadata file mapping each building
+    to the sensor UUIDs of its labels ({building: {label: sensor_id}}).
+    Return the number of sensors loaded.
+    '''
+    with open(path) as f:
+        metadata = json.load(f)
+
+    sensors = [
+        {"sensor_id": sensor_id.lower(), "building": building, "label": label, **parse_sensor_label(label)}
+        for building, labels in metadata.items()
+        for label, sensor_id in labels.items()
+    ]
+    sensors = list({sensor["sensor_id"]: sensor for sensor in sensors}.values())
+    if not sensors:
+        return 0
+
+    statement = insert(Sensor).values(sensors)
+    statement = statement.on_conflict_do_update(
+        index_elements=["sensor_id"],
+        set_={name: statement.excluded[name] for name in ["building", "zone", "kind", "unit", "label"]},
+    )
+    with bind.begin() as conn:
+        conn.execute(statement)
+        if sampling_interval:
+            # Default sampling interval, kept if already set for a sensor
+            conn.execute(
+                text("UPDATE sensor SET sampling_interval = CAST(:interval AS INTERVAL) WHERE sampling_interval IS NULL"),
+                {"interval": sampling_interval},
+            )
+    return len(sensors)
+
+
+# ======================================================================
+#                    CONTINUOUS AGGREGATES (ROLLUPS)
+# ======================================================================
+# Hourly and daily rollups of `measurement`, maintained by TimescaleDB.
+# Real-time aggregation is enabled (materialized_only = false), so the buckets
+# not yet materialized by the refresh policy are computed from the raw data.
+
+ROLLUPS = {
+    "hourly": {"view": "measurement_hourly", "interval": "1 hour",
+               "start_offset": "3 days", "end_offset": "1 hour", "schedule_interval": "30 minutes"},
+    "daily": {"view": "measurement_daily", "interval": "1 day",
+              "start_offset": "7 days", "end_offset": "1 day", "schedule_interval": "1 hour"},
+}
+
+ROLLUP_COLUMNS = ["mean", "min", "max", "sum", "count"]
+
+# Smallest end_offset of ROLLUPS: buckets newer than that are not materialized
+# yet and are read from the raw data, so writes there need no refresh
+ROLLUP_REFRESH_LAG = timedelta(hours=1)
+
+
+def _rollup_ddl(rollup: dict) -> list:
+    return [
+        f"""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS {rollup['view']}
+        WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+        SELECT time_bucket(INTERVAL '{rollup['interval']}', time) AS time,
+               sensor_id,
+               avg(value) AS mean,
+               min(value) AS min,
+               max(value) AS max,
+               sum(value) AS sum,
+               count(value) AS count
+        FROM {Measurement.__tablename__}
+        GROUP BY 1, sensor_id
+        WITH DATA;
+        """,
+        f"""
+        SELECT add_continuous_aggregate_policy('{rollup['view']}',
+            start_offset => INTERVAL '{rollup['start_offset']}',
+            end_offset => INTERVAL '{rollup['end_offset']}',
+            schedule_interval => INTERVAL '{rollup['schedule_interval']}',
+            if_not_exists => TRUE);
+        """,
+    ]
+
+
+def create_rollups(bind) -> None:
+    '''
+    Create the continuous aggregates and their refresh policies if missing.
+    Runs outside a transaction: TimescaleDB materializes a new continuous
+    aggregate (WITH DATA) only in autocommit mode.
+    '''
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for rollup in ROLLUPS.values():
+            for ddl in _rollup_ddl(rollup):
+                conn.execute(text(ddl))
+
+
+def refresh_rollups(bind, time_from: datetime, time_to: datetime) -> None:
+    '''
+    Re-materialize the rollups over [time_from, time_to], widened to whole days.
+    Needed after every write reaching the materialized buckets: the policy only
+    re-materializes its own window, later and never older changes. Writes newer
+    than ROLLUP_REFRESH_LAG (live data) return without touching the database.
+
+    The window is clamped to the retention horizon: the raw chunks older than it
+    may have been dropped, and refreshing their buckets would erase the rolled-up
+    data of every sensor.
+    '''
+    time_from, time_to = naive_utc(time_from), naive_utc(time_to)
+    if time_from >= datetime.now(timezone.utc).replace(tzinfo=None) - ROLLUP_REFRESH_LAG:
+        return
+
+    window_start = datetime.combine(time_from.date(), datetime.min.time())
+    window_end = datetime.combine(time_to.date(), datetime.min.time()) + timedelta(days=1)
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        horizon = conn.execute(text("""
+            SELECT (now() AT TIME ZONE 'UTC') - CAST(config->>'drop_after' AS INTERVAL)
+            FROM timescaledb_information.jobs
+            WHERE hypertable_name = :table_name AND proc_name = 'policy_retention'
+        """), {"table_name": Measurement.__tablename__}).scalar()
+        if horizon is not None:
+            window_start = max(window_start, datetime.combine(horizon.date(), datetime.min.time()) + timedelta(days=1))
+        if window_start >= window_end:
+            return
+
+        for rollup in ROLLUPS.values():
+            conn.execute(
+                text(f"CALL refresh_continuous_aggregate('{rollup['view']}', :window_start, :window_end)"),
+                {"window_start": window_start, "window_end": window_end},
+            )
+
+
+# Lightweight table constructs to query the continuous aggregates
+rollup_tables = {
+    resolution: table(
+        rollup["view"],
+        column("time", UTCDateTime),
+        column("sensor_id", UUID),
+        column("mean", Double),
+        column("min", Double),
+        column("max", Double),
+        column("sum", Double),
+        column("count", BigInteger),
+    )
+    for resolution, rollup in ROLLUPS.items()
+}
+
+
+# ======================================================================
+#                    COMPRESSION AND RETENTION
+# ======================================================================
+
+def get_storage_policy(bind) -> dict:
+    '''
+    Return the compression and retention policies of `measurement`
+    and the current compression statistics.
+    '''
+    table_name = Measurement.__tablename__
+    with bind.connect() as conn:
+        jobs = conn.execute(text("""
+            SELECT proc_name, config FROM timescaledb_information.jobs
+            WHERE hypertable_name = :table_name
+            AND proc_name IN ('policy_compression', 'policy_retention')
+        """), {"table_name": table_name}).all()
+        enabled = conn.execute(text("""
+            SELECT compression_enabled FROM timescaledb_information.hypertables
+            WHERE hypertable_name = :table_name
+        """), {"table_name": table_name}).scalar()
+        stats = None
+        if enabled:
+            stats = conn.execute(
+                text("SELECT * FROM hypertable_compression_stats(:table_name)"),
+                {"table_name": table_name},
+            ).mappings().first()
+
+    config = {proc_name: config for proc_name, config in jobs}
+    return {
+        "compress_after": config.get("policy_compression", {}).get("compress_after"),
+        "retention": config.get("policy_retention", {}).get("drop_after"),
+        "compression_enabled": bool(enabled),
+        "compression_stats": dict(stats) if stats else None,
+    }
+
+
+def apply_storage_policy(bind, compress_after: str | None, retention: str | None, policies: tuple = ("compression", "retention")) -> None:
+    '''
+    Set the compression and retention policies of `measurement`. Only the
+    policies listed in `policies` are changed, the other one is kept as is.
+
+    Compression is segmented by sensor_id and ordered by time DESC, which matches
+    the per-sensor range scans of the API. Retention only drops raw chunks: the
+    rollups are kept, so the retention window must be longer than the refresh
+    window of every rollup, otherwise a refresh would erase the rolled-up data
+    of the dropped chunks.
+    '''
+    table_name = Measurement.__tablename__
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Validate both intervals before touching the current policies
+        compression = "compression" in policies
+        retention_policy = "retention" in policies
+        if compression and compress_after:
+            conn.execute(text("SELECT CAST(:compress_after AS INTERVAL)"), {"compress_after": compress_after})
+        if retention_policy and retention:
+            for rollup in ROLLUPS.values():
+                longer = conn.execute(
+                    text("SELECT CAST(:retention AS INTERVAL) > CAST(:start_offset AS INTERVAL)"),
+                    {"retention": retention, "start_offset": rollup["start_offset"]},
+                ).scalar()
+                if not longer:
+                    raise ValueError(
+                        f"Retention '{retention}' must be longer than the refresh window "
+                        f"'{rollup['start_offset']}' of {rollup['view']}."
+                    )
+
+        if compression:
+            conn.execute(text("SELECT remove_compression_policy(:table_name, if_exists => TRUE)"), {"table_name": table_name})
+        if compression and compress_after:
+            enabled = conn.execute(text("""
+                SELECT compression_enabled FROM timescaledb_information.hypertables
+                WHERE hypertable_name = :table_name
+            """), {"table_name": table_name}).scalar()
+            if not enabled:
+                conn.execute(text(f"""
+                    ALTER TABLE {table_name} SET (
+                        timescaledb.compress,
+                        timescaledb.compress_segmentby = 'sensor_id',
+                        timescaledb.compress_orderby = 'time DESC'
+                    )
+                """))
+            conn.execute(
+                text("SELECT add_compression_policy(:table_name, compress_after => CAST(:compress_after AS INTERVAL))"),
+                {"table_name": table_name, "compress_after": compress_after},
+            )
+
+        if retention_policy:
+            conn.execute(text("SELECT remove_retention_policy(:table_name, if_exists => TRUE)"), {"table_name": table_name})
+        if retention_policy and retention:
+            conn.execute(
+                text("SELECT add_retention_policy(:table_name, drop_after => CAST(:retention AS INTERVAL))"),
+                {"table_name": table_name, "retention": retention},
+            )
@@ -0,0 +1,607 @@
+import base64
+import binascii
+from datetime import datetime, time, timezone
+from typing import List, Literal
+import uuid
+
+import pandas as pd
+from sqlalchemy import Select, select, delete, func, literal, literal_column, cast, case, extract, or_, BigInteger, Double, Time, UUID, text, tuple_
+
+import app.models as models
+
+
+# Bucket widths accepted by the read endpoints and the TimescaleDB interval they map to
+BUCKETS = {
+    "15min": "15 minutes",
+    "1h": "1 hour",
+    "1d": "1 day",
+    "1w": "1 week",
+    "1mo": "1 month",
+}
+
+# Aggregation functions applied to the values of a bucket
+AGGREGATIONS = {
+    "mean": func.avg,
+    "sum": func.sum,
+    "min": func.min,
+    "max": func.max,
+    "count": func.count,
+}
+
+Bucket = Literal["15min", "1h", "1d", "1w", "1mo"]
+Aggregation = Literal["mean", "sum", "min", "max", "count"]
+
+# Value given to the empty buckets of a gap-filled read: 'null' leaves them empty,
+# 'locf' carries the last value forward, 'linear' interpolates between neighbours
+FILLS = {
+    "locf": func.locf,
+    "linear": func.interpolate,
+}
+
+Fill = Literal["none", "null", "locf", "linear"]
+
+
+# Buckets that can be computed from a rollup (continuous aggregate) instead of the raw data
+ROLLUP_BUCKETS = {
+    "1h": "hourly",
+    "1d": "daily",
+    "1w": "daily",
+    "1mo": "daily",
+}
+
+
+def time_bucket(bucket: str, time_column=None):
+    '''
+    Return the `time_bucket` expression for one of the supported bucket widths.
+    The interval is rendered inline (it comes from BUCKETS, never from the client)
+    so that the same expression can be used in SELECT, GROUP BY and ORDER BY.
+    '''
+    if time_column is None:
+        time_column = models.Measurement.time
+    interval = literal_column(f"INTERVAL '{BUCKETS[bucket]}'")
+    return func.time_bucket(interval, time_column)
+
+
+def time_bucket_gapfill(bucket: str, time_column, start: datetime, finish: datetime):
+    '''
+    Return the `time_bucket_gapfill` expression of a bucket width: one bucket is
+    returned for every step between `start` and `finish`, even without any data.
+    '''
+    interval = literal_column(f"INTERVAL '{BUCKETS[bucket]}'")
+    return func.time_bucket_gapfill(
+        interval, time_column, literal(start, models.UTCDateTime), literal(finish, models.UTCDateTime)
+    )
+
+
+def _rollup_aggregate(rollup, agg: str):
+    '''Recombine the rollup columns of several buckets into one aggregation.'''
+    if agg == "mean":
+        # Division of the sums is NUMERIC: cast back so every driver returns a float
+        return cast(func.sum(rollup.c.sum) / func.sum(rollup.c.count), Double)
+    if agg == "count":
+        return cast(func.sum(rollup.c.count), BigInteger)
+    return AGGREGATIONS[agg](rollup.c[agg])
+
+
+def _aligned(value: datetime | None, resolution: str) -> bool:
+    '''True if `value` falls on a bucket boundary of the rollup resolution.'''
+    if value is None:
+        return True
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    if value.minute or value.second or value.microsecond:
+        return False
+    return resolution == "hourly" or value.hour == 0
+
+
+def encode_cursor(time: datetime, sensor_id) -> str:
+    '''Encode the (time, sensor_id) key of the last row of a page as an opaque cursor.'''
+    time = models.naive_utc(time)
+    return base64.urlsafe_b64encode(f"{time.isoformat()}|{sensor_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    '''
+    Return the (time, sensor_id) key encoded by `encode_cursor`.
+    Raise ValueError if the cursor is malformed.
+    '''
+    try:
+        time, sensor_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(time), uuid.UUID(sensor_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor '{cursor}'.") from e
+
+
+def measurement_query(
+    sensor_ids: List[str] | Select | None,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    bucket: str | None = None,
+    agg: str = "mean",
+    after: tuple | None = None,
+    fill: str = "none",
+):
+    '''
+    Build the SELECT returning (time, sensor_id, value) rows for the given sensors.
+
+    Parameters:
+    -----------
+    sensor_ids: list of sensor UUIDs to read, None to read every sensor, or a SELECT
+        of sensor UUIDs (see `sensor_query`) to read them with a semi-join.
+    time_from: inclusive lower bound of the time range.
+    time_to: exclusive upper bound of the time range.
+    bucket: key of BUCKETS; when set, rows are aggregated per bucket in the database.
+    agg: key of AGGREGATIONS, used only when `bucket` is set.
+    after: (time, sensor_id) key of the last row already read (see `decode_cursor`);
+        only the rows strictly after it are returned (keyset pagination).
+    fill: key of FILLS or 'null' to return every bucket of the time range on a
+        regular grid, 'none' to return only the buckets holding data. Needs
+        `bucket`, `time_from` and `time_to`, and cannot be combined with `after`.
+
+    Buckets of one hour or more are computed from the hourly/daily rollups when
+    the time range is aligned on them, instead of scanning the raw data.
+    '''
+    resolution = ROLLUP_BUCKETS.get(bucket)
+    if resolution and _aligned(time_from, resolution) and _aligned(time_to, resolution):
+        m = models.rollup_tables[resolution]
+        value = _rollup_aggregate(m, agg)
+    elif bucket is None:
+        m = models.Measurement.__table__
+    else:
+        m = models.Measurement.__table__
+        value = AGGREGATIONS[agg](m.c.value)
+
+    if bucket is None:
+        time_col = m.c.time
+        stmt = select(m.c.time, m.c.sensor_id, m.c.value)
+    else:
+        if fill == "none":
+            time_col = time_bucket(bucket, m.c.time)
+        else:
+            time_col = time_bucket_gapfill(bucket, m.c.time, time_from, time_to)
+            if fill in FILLS:
+                value = FILLS[fill](value)
+        stmt = (
+            select(time_col.label("time"), m.c.sensor_id, value.label("value"))
+            .group_by(time_col, m.c.sensor_id)
+        )
+
+    if sensor_ids is not None:
+        stmt = stmt.where(m.c.sensor_id.in_(sensor_ids))
+    if time_from is not None:
+        stmt = stmt.where(m.c.time >= time_from)
+    if time_to is not None:
+        stmt = stmt.where(m.c.time < time_to)
+    if after is not None:
+        # Typed binds: PostgreSQL has no operator comparing a uuid with a varchar
+        after_time, after_sensor_id = literal(after[0], models.UTCDateTime), literal(after[1], UUID)
+        if bucket is None:
+            stmt = stmt.where(tuple_(m.c.time, m.c.sensor_id) > tuple_(after_time, after_sensor_id))
+        else:
+            # Buckets after the cursor only hold rows from its time on
+            stmt = (
+                stmt.where(m.c.time >= after_time)
+                .having(tuple_(time_col, m.c.sensor_id) > tuple_(after_time, after_sensor_id))
+            )
+
+    return stmt.order_by(time_col, m.c.sensor_id)
+
+
+def pivot_wide(rows, sensor_ids: List[str]) -> dict:
+    '''
+    Pivot (time, sensor_id, value) rows into one column per sensor aligned on time.
+
+    Returns a column-oriented dict {"time": [...], "<sensor_id>": [...], ...} where
+    missing samples are None. Every requested sensor gets a column, even if empty.
+    '''
+    df = pd.DataFrame(rows, columns=["time", "sensor_id", "value"])
+    df["sensor_id"] = df["sensor_id"].astype(str)
+
+    wide = df.pivot(index="time", columns="sensor_id", values="value")
+    wide = wide.reindex(columns=sensor_ids).sort_index()
+    wide = wide.astype(object).where(wide.notna(), None)
+
+    data = {"time": wide.index.tolist()}
+    for sensor_id in sensor_ids:
+        data[sensor_id] = wide[sensor_id].tolist()
+    return data
+
+
+def rollup_query(
+    resolution: str,
+    sensor_ids: List[str],
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+):
+    '''
+    Build the SELECT returning the rows of the hourly or daily rollup
+    (time, sensor_id, mean, min, max, sum, count) for the given sensors.
+    '''
+    rollup = models.rollup_tables[resolution]
+    stmt = select(rollup).where(rollup.c.sensor_id.in_(sensor_ids))
+    if time_from is not None:
+        stmt = stmt.where(rollup.c.time >= time_from)
+    if time_to is not None:
+        stmt = stmt.where(rollup.c.time < time_to)
+    return stmt.order_by(rollup.c.time, rollup.c.sensor_id)
+
+
+# First/last point and row count of each sensor. First and last are index lookups
+# on (sensor_id, time DESC); the count is summed from the daily rollup, only over
+# the buckets from the day of the first raw point, so that it matches the raw span
+# once retention has dropped old chunks.
+SUMMARY_SQL = """
+    SELECT s.sensor_id,
+           f.time AS first_time,
+           l.time AS last_time,
+           l.value AS last_value,
+           c.count
+    FROM {sensors} AS s(sensor_id)
+    LEFT JOIN LATERAL (
+        SELECT time FROM measurement m
+        WHERE m.sensor_id = s.sensor_id ORDER BY time ASC LIMIT 1
+    ) f ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT time, value FROM measurement m
+        WHERE m.sensor_id = s.sensor_id ORDER BY time DESC LIMIT 1
+    ) l ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT CAST(coalesce(sum(d.count), 0) AS BIGINT) AS count FROM measurement_daily d
+        WHERE d.sensor_id = s.sensor_id AND d.time >= time_bucket(INTERVAL '1 day', f.time)
+    ) c ON TRUE
+    {where}
+    ORDER BY s.sensor_id
+"""
+
+
+def summary_query(sensor_ids: List[str] | None):
+    '''
+    Build the query returning (sensor_id, first_time, last_time, last_value, count)
+    for the given sensors in one round trip, or for every sensor holding raw data
+    if None. `count` is read from the daily rollup, over the days of the raw span.
+    '''
+    if sensor_ids is None:
+        # Sensors listed by the rollup but without raw data left are skipped
+        return text(SUMMARY_SQL.format(
+            sensors="(SELECT DISTINCT sensor_id FROM measurement_daily)",
+            where="WHERE f.time IS NOT NULL",
+        ))
+    return text(SUMMARY_SQL.format(sensors="unnest(CAST(:sensor_ids AS uuid[]))", where="")).bindparams(sensor_ids=sensor_ids)
+
+
+# Last stored point of each sensor, one index lookup on (sensor_id, time DESC) per sensor
+LATEST_SQL = """
+    SELECT s.sensor_id, l.time, l.value
+    FROM unnest(CAST(:sensor_ids AS uuid[])) AS s(sensor_id)
+    LEFT JOIN LATERAL (
+        SELECT time, value FROM measurement m
+        WHERE m.sensor_id = s.sensor_id ORDER BY time DESC LIMIT 1
+    ) l ON TRUE
+"""
+
+
+def latest_query(sensor_ids: List[str]):
+    '''Build the query returning (sensor_id, time, value) of the last point of each sensor.'''
+    return text(LATEST_SQL).bindparams(sensor_ids=sensor_ids)
+
+
+def _statistics(value, percentiles: List[float], prefix: str = "", where=None) -> list:
+    '''Aggregates of `value` labelled `<prefix><name>`, restricted to the rows matching `where`.'''
+    aggregates = {
+        "count": func.count(value),
+        "min": func.min(value),
+        "max": func.max(value),
+        "mean": func.avg(value),
+        "median": func.percentile_cont(literal(0.5, Double)).within_group(value),
+    }
+    for i, percentile in enumerate(percentiles):
+        aggregates[f"p{i}"] = func.percentile_cont(literal(percentile, Double)).within_group(value)
+    if where is not None:
+        aggregates = {name: aggregate.filter(where) for name, aggregate in aggregates.items()}
+    return [aggregate.label(prefix + name) for name, aggregate in aggregates.items()]
+
+
+def stats_query(
+    sensor_id: str,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    percentiles: List[float] = (),
+    window: tuple = (time(8), time(18)),
+):
+    '''
+    Build the single-row SELECT of the statistics of a sensor over a time range:
+    count, min, max, mean, median and the given percentiles (p0, p1, ...), once
+    over every value and once (prefixed by 'window_') over the values whose time
+    of day is between the two bounds of `window`, both included (wrapping around
+    midnight if the first bound is the later one, e.g. 22:00-06:00).
+    '''
+    m = models.Measurement.__table__
+    time_of_day = cast(m.c.time, Time)
+    start, end = window
+    in_window = time_of_day.between(start, end) if start <= end else or_(time_of_day >= start, time_of_day <= end)
+
+    stmt = select(
+        *_statistics(m.c.value, percentiles),
+        *_statistics(m.c.value, percentiles, prefix="window_", where=in_window),
+    ).where(m.c.sensor_id == sensor_id)
+    if time_from is not None:
+        stmt = stmt.where(m.c.time >= time_from)
+    if time_to is not None:
+        stmt = stmt.where(m.c.time < time_to)
+    return stmt
+
+
+def outlier_query(
+    sensor_ids: List[str],
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    window: int | None = None,
+    threshold: float = 3.0,
+):
+    '''
+    Build the SELECT returning (time, sensor_id, value, mean, stddev, zscore) of the
+    measurements whose z-score is above `threshold` in absolute value.
+
+    Without `window`, the z-score is global: each value is compared with the mean
+    and population standard deviation of its sensor over the time range (as
+    scipy.stats.zscore). With `window`, it is rolling: each value is compared with
+    the `window` values of its sensor just before it, and is only tested once that
+    many values are available.
+    '''
+    m = models.Measurement.__table__
+    frame = {"partition_by": m.c.sensor_id}
+    if window:
+        frame.update(order_by=m.c.time, rows=(-window, -1))
+
+    scored = select(
+        m.c.time, m.c.sensor_id, m.c.value,
+        func.avg(m.c.value, type_=Double).over(**frame).label("mean"),
+        func.stddev_pop(m.c.value, type_=Double).over(**frame).label("stddev"),
+        func.count(m.c.value).over(**frame).label("count"),
+    ).where(m.c.sensor_id.in_(sensor_ids))
+    if time_from is not None:
+        scored = scored.where(m.c.time >= time_from)
+    if time_to is not None:
+        scored = scored.where(m.c.time < time_to)
+    scored = scored.subquery("scored")
+
+    # A constant series has no deviation: its values are never flagged
+    zscore = ((scored.c.value - scored.c.mean) / func.nullif(scored.c.stddev, 0, type_=Double)).label("zscore")
+    stmt = select(
+        scored.c.time, scored.c.sensor_id, scored.c.value,
+        scored.c.mean, scored.c.stddev, zscore,
+    ).where(func.abs(zscore) > threshold)
+    if window:
+        stmt = stmt.where(scored.c.count == window)
+    return stmt.order_by(scored.c.sensor_id, scored.c.time)
+
+
+def period_query(
+    sensor_ids: List[str],
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    opening: tuple = (7, 20),
+    by_month: bool = False,
+):
+    '''
+    Build the SELECT returning (sensor_id, [month,] period, sum, mean, count) of the
+    values of each sensor split into opening and closing hours.
+
+    A value is in the 'opening' period when the hour of its time is between the two
+    bounds of `opening` (both included, wrapping around midnight if the first bound
+    is the larger one), otherwise in the 'closing' period. The periods are whole
+    hours, so they are computed from the hourly rollup when the time range is
+    aligned on hours.
+    '''
+    if _aligned(time_from, "hourly") and _aligned(time_to, "hourly"):
+        m = models.rollup_tables["hourly"]
+        total = func.sum(m.c.sum)
+        count = cast(func.sum(m.c.count), BigInteger)
+        mean = cast(total / func.sum(m.c.count), Double)
+    else:
+        m = models.Measurement.__table__
+        total, count, mean = func.sum(m.c.value), func.count(m.c.value), func.avg(m.c.value)
+
+    hour = extract("hour", m.c.time)
+    first, last = opening
+    is_opening = hour.between(first, last) if first <= last else or_(hour >= first, hour <= last)
+    period = case((is_opening, "opening"), else_="closing").label("period")
+
+    keys = [m.c.sensor_id]
+    if by_month:
+        keys.append(func.date_trunc("month", m.c.time).label("month"))
+    keys.append(period)
+
+    stmt = (
+        select(*keys, total.label("sum"), mean.label("mean"), count.label("count"))
+        .where(m.c.sensor_id.in_(sensor_ids))
+        .group_by(*keys)
+        .order_by(*keys)
+    )
+    if time_from is not None:
+        stmt = stmt.where(m.c.time >= time_from)
+    if time_to is not None:
+        stmt = stmt.where(m.c.time < time_to)
+    return stmt
+
+
+# Heating and cooling seasons of the degree days
+HEATING_MONTHS = [10, 11, 12, 1, 2, 3, 4]
+COOLING_MONTHS = [5, 6, 7, 8, 9]
+
+
+def degree_days_query(
+    sensor_id: str,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+    heating_base: float = 18,
+    cooling_base: float = 26,
+    heating_months: List[int] = HEATING_MONTHS,
+    cooling_months: List[int] = COOLING_MONTHS,
+    power_sensor_id: str | None = None,
+    energy_factor: float = 0.25,
+):
+    '''
+    Build the SELECT returning (time, temperature, hdd, cdd[, energy]) per day from the
+    daily rollup of an outdoor temperature sensor.
+
+    HDD is max(0, heating_base - daily mean) in the heating months and CDD is
+    max(0, daily mean - cooling_base) in the cooling months, 0 otherwise. If
+    `power_sensor_id` is given, only the days with power data are returned and
+    `energy` is the daily sum of its values times `energy_factor` (the duration of a
+    sample in hours, 0.25 for a power sampled every 15 minutes).
+    '''
+    temperature = models.rollup_tables["daily"].alias("temperature")
+    month = extract("month", temperature.c.time)
+    heating_base = literal(heating_base, Double)
+    cooling_base = literal(cooling_base, Double)
+
+    columns = [
+        temperature.c.time,
+        temperature.c.mean.label("temperature"),
+        case((month.in_(heating_months), func.greatest(0, heating_base - temperature.c.mean)), else_=0).label("hdd"),
+        case((month.in_(cooling_months), func.greatest(0, temperature.c.mean - cooling_base)), else_=0).label("cdd"),
+    ]
+    source = temperature
+    if power_sensor_id is not None:
+        power = models.rollup_tables["daily"].alias("power")
+        columns.append((power.c.sum * literal(energy_factor, Double)).label("energy"))
+        source = temperature.join(
+            power, (power.c.time == temperature.c.time) & (power.c.sensor_id == power_sensor_id)
+        )
+
+    stmt = select(*columns).select_from(source).where(temperature.c.sensor_id == sensor_id)
+    if time_from is not None:
+        stmt = stmt.where(temperature.c.time >= time_from)
+    if time_to is not None:
+        stmt = stmt.where(temperature.c.time < time_to)
+    return stmt.order_by(temperature.c.time)
+
+
+def delete_range_query(
+    sensor_ids: List[str] | None,
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+):
+    '''
+    Build the single statement deleting the rows of the given sensors (every sensor
+    if None) in [time_from, time_to) and returning (count, time_min, time_max) of
+    the deleted rows.
+    '''
+    m = models.Measurement.__table__
+    stmt = delete(m)
+    if sensor_ids is not None:
+        stmt = stmt.where(m.c.sensor_id.in_(sensor_ids))
+    if time_from is not None:
+        stmt = stmt.where(m.c.time >= time_from)
+    if time_to is not None:
+        stmt = stmt.where(m.c.time < time_to)
+    deleted = stmt.returning(m.c.time).cte("deleted")
+    return select(func.count().label("count"), func.min(deleted.c.time).label("time_min"), func.max(deleted.c.time).label("time_max"))
+
+
+# Delete a list of (sensor_id, time) rows in one statement
+DELETE_KEYS_SQL = """
+    WITH deleted AS (
+        DELETE FROM measurement m
+        USING unnest(CAST(:sensor_ids AS uuid[]), CAST(:times AS timestamp[])) AS d(sensor_id, time)
+        WHERE m.sensor_id = d.sensor_id AND m.time = d.time
+        RETURNING m.time
+    )
+    SELECT count(*) AS count, min(time) AS time_min, max(time) AS time_max FROM deleted
+"""
+
+
+def delete_keys_query(keys: List[tuple]):
+    '''
+    Build the statement deleting the (sensor_id, time) rows of `keys` and returning
+    (count, time_min, time_max) of the deleted rows.
+    '''
+    return text(DELETE_KEYS_SQL).bindparams(
+        sensor_ids=[str(sensor_id).lower() for sensor_id, _ in keys],
+        times=[models.naive_utc(time) for _, time in keys],
+    )
+
+
+# Drop the chunks of the hypertable lying entirely inside [time_from, time_to)
+DROP_CHUNKS_SQL = """
+    SELECT count(*) FROM drop_chunks(
+        'measurement',
+        older_than => CAST(:time_to AS timestamp),
+        newer_than => CAST(:time_from AS timestamp)
+    )
+"""
+
+
+def drop_chunks_query(time_from: datetime, time_to: datetime):
+    '''Build the statement dropping the chunks covered by the range, returning their number.'''
+    return text(DROP_CHUNKS_SQL).bindparams(time_from=models.naive_utc(time_from), time_to=models.naive_utc(time_to))
+
+
+def validator_query(
+    sensor_ids: List[str],
+    time_from: datetime | None = None,
+    time_to: datetime | None = None,
+):
+    '''
+    Build the SELECT returning (count, time_max, generation, modified_at) of the given
+    sensors: number and last time of their raw rows in the time range, read from
+    the (sensor_id, time) index, and their write generation and last write time
+    (see models.MeasurementWrite). It changes whenever a row of these sensors is
+    added, removed or updated, so it is used to validate cached responses.
+    '''
+    m = models.Measurement.__table__
+    w = models.MeasurementWrite.__table__
+    writes = select().where(w.c.sensor_id.in_(sensor_ids))
+    stmt = (
+        select(
+            func.count().label("count"),
+            func.max(m.c.time).label("time_max"),
+            writes.add_columns(func.coalesce(func.sum(w.c.generation), 0)).scalar_subquery().label("generation"),
+            writes.add_columns(func.max(w.c.modified_at)).scalar_subquery().label("modified_at"),
+        )
+        .where(m.c.sensor_id.in_(sensor_ids))
+    )
+    if time_from is not None:
+        stmt = stmt.where(m.c.time >= time_from)
+    if time_to is not None:
+        stmt = stmt.where(m.c.time < time_to)
+    return stmt
+
+
+# Bump the write generation of a list of sensors
+RECORD_WRITE_SQL = """
+    INSERT INTO measurement_write (sensor_id, generation, modified_at)
+    SELECT DISTINCT sensor_id, 1, now() AT TIME ZONE 'UTC'
+    FROM unnest(CAST(:sensor_ids AS uuid[])) AS s(sensor_id)
+    ORDER BY sensor_id
+    ON CONFLICT (sensor_id) DO UPDATE
+    SET generation = measurement_write.generation + 1, modified_at = EXCLUDED.modified_at
+"""
+
+RECORD_WRITE_ALL_SQL = """
+    UPDATE measurement_write SET generation = generation + 1, modified_at = now() AT TIME ZONE 'UTC'
+"""
+
+
+def record_write_query(sensor_ids: List[str] | None):
+    '''
+    Build the statement bumping the write generation of the given sensors, or of
+    every sensor if None. Run it in the transaction of the write.
+    '''
+    if sensor_ids is None:
+        return text(RECORD_WRITE_ALL_SQL)
+    return text(RECORD_WRITE_SQL).bindparams(sensor_ids=sorted({str(sensor_id).lower() for sensor_id in sensor_ids}))
+
+
+def sensor_query(building: str | None = None, kind: str | None = None, zone: str | None = None):
+    '''Build the SELECT of the registered sensors matching the given building, kind and zone.'''
+    sensor = models.Sensor.__table__
+    stmt = select(sensor)
+    if building is not None:
+        stmt = stmt.where(sensor.c.building == building)
+    if kind is not None:
+        stmt = stmt.where(sensor.c.kind == kind)
+    if zone is not None:
+        stmt = stmt.where(sensor.c.zone == zone)
+    return stmt.order_by(sensor.c.building, sensor.c.kind, sensor.c.zone, sensor.c.sensor_id)
@@ -18,5 +18,14 @@ import uuid
 
 class Measurement(BaseModel):
     time: datetime
-    sensor_id: str
-    value: float
\ No newline at end of file
+    sensor_id: uuid.UUID
+    value: float
+
+class MeasurementKey(BaseModel):
+    time: datetime
+    sensor_id: uuid.UUID
+
+class StoragePolicy(BaseModel):
+    # PostgreSQL intervals (e.g. '30 days'); None disables the policy
+    compress_after: Union[str, None] = None
+    retention: Union[str, None] = None
@@ -21,3 +21,77 @@ CREATE TABLE public.measurement (
 );
 
 SELECT create_hypertable('public.measurement', 'time', if_not_exists => TRUE, create_default_indexes => TRUE);
+
+--
+-- Hourly and daily rollups (continuous aggregates) of measurement
+--
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.measurement_hourly
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '1 hour', time) AS time,
+       sensor_id,
+       avg(value) AS mean,
+       min(value) AS min,
+       max(value) AS max,
+       sum(value) AS sum,
+       count(value) AS count
+FROM public.measurement
+GROUP BY 1, sensor_id
+WITH DATA;
+
+SELECT add_continuous_aggregate_policy('public.measurement_hourly',
+    start_offset => INTERVAL '3 days',
+    end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '30 minutes',
+    if_not_exists => TRUE);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS public.measurement_daily
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT time_bucket(INTERVAL '1 day', time) AS time,
+       sensor_id,
+       avg(value) AS mean,
+       min(value) AS min,
+       max(value) AS max,
+       sum(value) AS sum,
+       count(value) AS count
+FROM public.measurement
+GROUP BY 1, sensor_id
+WITH DATA;
+
+SELECT add_continuous_aggregate_policy('public.measurement_daily',
+    start_offset => INTERVAL '7 days',
+    end_offset => INTERVAL '1 day',
+    schedule_interval => INTERVAL '1 hour',
+    if_not_exists => TRUE);
+
+--
+-- Per-sensor index for range scans and first/last lookups
+--
+
+CREATE INDEX IF NOT EXISTS ix_measurement_sensor_id_time ON public.measurement (sensor_id, time DESC);
+
+--
+-- Sensor registry: building, zone and kind of each sensor
+--
+
+CREATE TABLE IF NOT EXISTS public.sensor (
+    sensor_id uuid PRIMARY KEY,
+    building VARCHAR NOT NULL,
+    zone VARCHAR,
+    kind VARCHAR NOT NULL,
+    unit VARCHAR,
+    label VARCHAR,
+    sampling_interval INTERVAL
+);
+
+CREATE INDEX IF NOT EXISTS ix_sensor_building_kind ON public.sensor (building, kind);
+
+--
+-- Write generation of each sensor, bumped by every write: validates cached reads
+--
+
+CREATE TABLE IF NOT EXISTS public.measurement_write (
+    sensor_id uuid PRIMARY KEY,
+    generation BIGINT NOT NULL,
+    modified_at TIMESTAMP NOT NULL
+);